@@ -9,6 +9,7 @@ import time
 import sys
 import numpy as np
 from birdCam_jetson_ml import *
+from birdCam_log import eventLog
 import datetime
 import requests
 
@@ -113,6 +114,9 @@ outputFolderInit()
 # initialize birdCam
 print("Initializing BirdCam...")
 birdCam = birdCam_trt(model_path)
+# per-frame messages go to a rotating log file instead of the console
+log = eventLog(output_folder+'birdCam.log',level='debug',consoleLevel='info',rateLimit=50)
+birdCam.setLog(log)
 birdCam.initCNN(init_im_path) #initialize CNN model
 birdCam.initCam() #initialize camera (has to be done after CNN initialization)
 #birdCam.initCam(vidFile=base_folder+'1611933860.avi') # program exits if initialization fails
@@ -140,11 +144,12 @@ ret_val = True # status of video stream
 fcnt = 0
 while ret_val:
     if terminate:
+        log.close()
         birdCam.terminate()
         
     ret_val, frame = birdCam.readFrame()
 
-    print(birdCam.fcnt)
+    log.debug('frame',fcnt=birdCam.fcnt)
 
     if birdCam.fcnt<30: # wait for camera to stabilize
         continue
@@ -210,14 +215,14 @@ while ret_val:
             birdCam.appendDataArray(np.array([[species,confidence]])) # append to data array
 
         elif birdCam.isBird(species) and (time.time()-lastPicT>picInterval): # take new image as time passes
-            print('Still seeing...')
+            log.debug('stillSeeing',species=species,confidence=float(confidence))
             lastPicT = time.time() # update time image taken
             birdCam.appendImSet(roi) # add roi to image array
             birdCam.flags[1] = True
             birdCam.appendDataArray(np.array([[species,confidence]])) # append to data array
 
         elif birdCam.isBird(species): # still seeing bird
-            print('Still seeing...')
+            log.debug('stillSeeing',species=species,confidence=float(confidence))
             birdCam.flags[1] = True
             birdCam.appendDataArray(np.array([[species,confidence]])) # append to data array
 
@@ -0,0 +1,267 @@
+# birdCam_ML_multi
+# updated October 2026
+# Run several cameras (e.g. one per feeder) on one Jetson Nano with a single MobileNetV2 CNN.
+# Every camera has its own capture, calibration and visit state; the ROIs of all cameras
+# are classified in one batch per tick.
+
+import cv2
+import signal
+import os
+import time
+import sys
+import argparse
+import numpy as np
+from birdCam_jetson_ml import *
+from birdCam_gate import motionGate, rateScheduler, resultCache
+from birdCam_upload import uploadQueue
+from birdCam_writer import imageWriter
+from birdCam_visit import visitTracker, wallClock, speciesSmoother
+from birdCam_store import sightingStore
+from birdCam_calib import calibService
+from birdCam_multi import sharedInference
+from birdCam_metrics import metricsRegistry, metricsServer
+from birdCam_log import eventLog
+
+# argument parser
+parser = argparse.ArgumentParser(description = "BirdCam with several cameras")
+parser.add_argument("-n", "--cameras", type=int,default=2,help="Number of CSI cameras (sensor-id 0 to n-1)")
+parser.add_argument("-v", "--video", type=str,nargs='*',default=None,help="Video files to run instead of the cameras, one per camera")
+parser.add_argument("-c", "--crop", action="store_true",help="Crop frames to the ROI inside the gstreamer pipeline after calibration")
+parser.add_argument("-o", "--output", type=str,default="/home/pichaya/birdCam_ML/ML06/",help="Output folder; camera k writes to cam<k>/")
+args = parser.parse_args()
+
+base_folder = "/home/pichaya/birdCam_ML/"
+output_folder = args.output
+model_path = '/home/pichaya/birdCam_ML/birdCam_MobileNetV2_20210530_TFTRT_FP16'
+init_im_path = '/home/pichaya/birdCam_ML/last_sight.jpg'
+
+# for gracefully terminate program with SIGINT
+def terminateProcess(signalNumber, frame):
+    global terminate # declare video capture from global variable
+    terminate = True
+    print('Received: SIGINT at %d'%time.time())
+    print(terminate)
+    return
+
+def textImage(frame,species,confidence,camName):
+    # for putting text
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    org = (50, 50)
+    fontScale = 1
+    color = (255, 0, 0)
+    thickness = 2
+    text = "%s %s   %.2f"%(camName,className[species],confidence)
+    imOut = cv2.putText(frame, text, org, font,fontScale, color, thickness, cv2.LINE_AA)
+    return imOut
+
+def outputFolderInit(folder,classNum=4):
+    '''Initialize output folders of one camera.'''
+    print("Initializing output folder %s..."%folder)
+    for sub in ['','bgimages','blankIm']+["bird_%.2d"%k for k in range(classNum)]:
+        if not os.path.isdir(folder+sub):
+            print("Folder %s not found. Creating the folder"%(folder+sub))
+            os.makedirs(folder+sub)
+    print("Done Initializing folder.")
+
+
+# for SIGNINT interruption
+terminate = False
+signal.signal(signal.SIGINT, terminateProcess)
+
+# url for uploading image
+urlFile = '******'
+
+print("-------BirdCam program (multi camera)----------")
+
+camNum = len(args.video) if args.video else args.cameras
+className = ['Sparrow','Junco','Towhee','Juncojv','Rat','Snail','Blank']
+lostThresh = 3 # how long can bird gone before counting as new bird in seconds
+picInterval = 0.5 # interval between image storage in seconds
+valThresh = 12500
+birdValThresh = 15000
+
+# shared by all cameras
+uploader = uploadQueue(urlFile,output_folder+'spool/',
+    data={'password':'******', 'submit':'submit','ftype':'image'},
+    headers={'User-Agent': 'My User Agent 1.0'})
+uploader.start()
+# only blank and background images are dropped when the queue is full
+writer = imageWriter(workers=1,maxQueue=16*camNum,policy='dropOldest',
+    encodeParams={'blankIm/':[cv2.IMWRITE_JPEG_QUALITY,80],'bgimages/':[cv2.IMWRITE_JPEG_QUALITY,80]})
+
+# per-frame messages go to a rotating JSON log (replay with birdCam_log.py); visit events also go to the console
+log = eventLog(output_folder+'birdCam.log',level='debug',consoleLevel='info',rateLimit=50*camNum)
+
+# one camera unit per sensor: capture, calibration, gate, scheduler and visit state
+units = []
+for k in range(camNum):
+    unit = {'name':'cam%d'%k,'folder':output_folder+'cam%d/'%k,'first':True}
+    outputFolderInit(unit['folder'],classNum=len(className))
+    print("Initializing BirdCam %d..."%k)
+    # all cameras use the engine of the first one, so only one TF runtime is loaded
+    birdCam = birdCam_trt(model_path,className = className, output_decoder = [6,1,4,5,3,0,2],
+        imSetBytes=16e6, imSetJpeg=True, maxBatch=camNum, sensorId=k,
+        backend=units[0]['birdCam'].backend if k>0 else None)
+    birdCam.setLog(log)
+    birdCam.setCache(resultCache(capacity=16,hashSize=16,maxBits=6,maxLevel=8.0,ttl=5.0)) # reuse results of an unchanged ROI
+    birdCam.initCNN(init_im_path)
+    if args.video:
+        birdCam.initCam(vidFile=args.video[k],threaded=True,poolSize=8)
+    else:
+        birdCam.initCam(threaded=True,poolSize=8) # capture into 8 reused buffers
+    unit['birdCam'] = birdCam
+    unit['store'] = sightingStore(unit['folder']+"birdCam.db")
+    unit['calib'] = calibService(birdCam,scale=8,checkInterval=10.0,driftThresh=0.9)
+    unit['gate'] = motionGate(birdCam,mode='both',valThresh=valThresh,birdValThresh=birdValThresh,holdFrames=30,
+        cache=birdCam.cache) # motion invalidates the cached results
+    unit['scheduler'] = rateScheduler(idleHz=0.5,burstHz=10.0,visitHz=None,burstSec=2.0,targetLatency=2.0)
+    unit['tracker'] = visitTracker(birdCam,clock=wallClock(),lostThresh=lostThresh,picInterval=picInterval,
+        blankInterval=15*60,smoother=speciesSmoother(len(className),alpha=0.3,decideThresh=0.8,minFrames=3))
+    units.append(unit)
+unitOf = dict((unit['birdCam'].sensorId,unit) for unit in units)
+units[0]['birdCam'].setImageWriter(writer) # the shared writer is closed by the first camera's terminate()
+engine = sharedInference(units[0]['birdCam'].backend)
+
+# per-stage metrics, served at http://localhost:9108/metrics; per-camera series carry a camera label
+metrics = metricsRegistry()
+for unit in units:
+    cam = {'camera':unit['name']}
+    unit['stageTime'] = dict((stage,metrics.histogram('birdcam_stage_seconds','Latency of each stage of the frame loop',
+        labels=dict(cam,stage=stage))) for stage in ('capture','gate','visit'))
+    unit['framesTotal'] = metrics.counter('birdcam_frames_total','Frames read from the camera',labels=cam)
+    unit['visitsTotal'] = metrics.counter('birdcam_visits_total','Completed bird visits',labels=cam)
+    metrics.addStats('birdcam_capture',unit['birdCam'].captureStats,labels=cam)
+    metrics.addStats('birdcam_gate',unit['gate'].stats,labels=cam)
+    metrics.addStats('birdcam_cache',unit['birdCam'].cache.stats,labels=cam)
+    metrics.addStats('birdcam_scheduler',unit['scheduler'].stats,labels=cam)
+    metrics.addStats('birdcam_calib',unit['calib'].stats,labels=cam)
+inferTime = metrics.histogram('birdcam_stage_seconds','Latency of each stage of the frame loop',labels={'camera':'all','stage':'inference'})
+for stage,component in (('preprocess',engine.backend.prep),('write',writer),('upload',uploader)): # shared by all cameras
+    component.setLatencyHistogram(metrics.histogram('birdcam_stage_seconds',labels={'camera':'all','stage':stage}))
+metrics.addStats('birdcam_backend',units[0]['birdCam'].backend.stats)
+metrics.addStats('birdcam_shared',engine.stats)
+metrics.addStats('birdcam_writer',writer.stats)
+metrics.addStats('birdcam_upload',uploader.stats)
+metrics.addStats('birdcam_log',log.stats)
+metricsServer(metrics,port=9108).start()
+
+def handleEvent(unit,ev):
+    '''Act on an event from the visit state machine of one camera.'''
+    birdCam = unit['birdCam']
+    folder = unit['folder']
+    if ev.kind=='arrive':
+        log.info('arrive',camera=unit['name'],species=className[ev.info['species']],confidence=float(ev.info['confidence']))
+        unit['scheduler'].arrival(ev.t)
+    elif ev.kind=='early':
+        log.info('early',camera=unit['name'],species=className[ev.info['species']],confidence=float(ev.info['confidence']))
+    elif ev.kind=='leaving':
+        log.info('leaving',camera=unit['name'])
+    elif ev.kind=='blank':
+        writer.write(folder+'blankIm/%d.jpg'%ev.t,ev.info['roi'])
+    elif ev.kind=='gone':
+        unit['visitsTotal'].inc()
+        species_final = ev.info['species']
+        confidence_final = ev.info['confidence']
+        if species_final is None:
+            log.info('gone',camera=unit['name'],species=None,duration=ev.info['duration']) # no valid picture
+            return
+        log.info('gone',camera=unit['name'],species=className[species_final],confidence=float(confidence_final),
+            vote=ev.info['vote'],duration=ev.info['duration'])
+        roi_save = ev.info['roi']
+        imName = folder+'bird_%02d/%d.jpg'%(species_final,birdCam.time)
+        writer.write(imName,roi_save,policy='block') # visit records are never dropped
+        unit['store'].add(birdCam.time,species_final,confidence_final,ev.info['duration'],imName,vote=ev.info['vote'])
+
+        # upload data to server
+        imText = textImage(roi_save,species_final,confidence_final,unit['name'])
+        fname = folder+'last_sight.jpg'
+        writer.write(fname,imText,callback=uploader.submit,policy='block') # upload once the file is on disk
+
+def shutdown():
+    for unit in units:
+        print(unit['name'],unit['gate'].stats(),unit['scheduler'].stats(),unit['calib'].stats())
+        unit['calib'].stop()
+    print(engine.stats())
+    print(uploader.stats())
+    print(writer.stats())
+    print(log.stats())
+    writer.flush() # last images may still queue uploads
+    for unit in units:
+        unit['store'].close()
+    uploader.stop()
+    log.close()
+    for unit in units[1:]:
+        unit['birdCam'].release()
+    units[0]['birdCam'].terminate() # closes the image writer
+
+#---------- Main Loop of Cameras----------------#
+# the main loop runs until SIGINT is received or a stream ends.
+bgTime = time.time()
+running = True
+while running:
+    if terminate:
+        shutdown()
+
+    # read one frame of every camera and queue the ROIs that need the CNN
+    for unit in units:
+        birdCam = unit['birdCam']
+        tracker = unit['tracker']
+        startT = time.perf_counter()
+        ret_val, frame = birdCam.readFrame()
+        unit['stageTime']['capture'].observe(time.perf_counter()-startT)
+        unit['framesTotal'].inc()
+        if not ret_val:
+            running = False
+            break
+        if birdCam.fcnt<30: # wait for camera to stabilize
+            continue
+
+        # calibrate background
+        if unit['first']:
+            x1,x2 = unit['calib'].start(frame)
+            print("%s: Finished calibrating background"%unit['name'])
+            bgim = cv2.rectangle(frame.copy(), (x1, 0), (x2, frame.shape[0]-1), (255, 0, 0), 2)
+            writer.write(unit['folder']+'bgimages/bg_%d.jpg'%time.time(),bgim,copy=False)
+            unit['first'] = False
+            if args.crop and birdCam.setCrop(tapFile='/tmp/birdCam_%s_full_%%05d.jpg'%unit['name']): # pipeline only converts the ROI
+                continue
+        else:
+            calibFrame = birdCam.fullFrame() if birdCam.cropped else frame # while cropped, full frames come from the tap
+            if calibFrame is not None and unit['calib'].check(calibFrame,busy=tracker.inVisit): # feeder moved; new xlim swapped in between visits
+                x1,x2 = birdCam.xlim
+                birdCam.cache.clear() # cached results belong to the old ROI
+                bgim = cv2.rectangle(calibFrame.copy(), (x1, 0), (x2, calibFrame.shape[0]-1), (255, 0, 0), 2)
+                writer.write(unit['folder']+'bgimages/bg_%d.jpg'%time.time(),bgim,copy=False)
+                if birdCam.cropped:
+                    birdCam.setCrop(tapFile=birdCam.tapFile) # crop the new ROI in the pipeline
+                    continue
+
+        roi = birdCam.getRoi(frame)
+        now = tracker.clock.now()
+        startT = time.perf_counter()
+        motion = (not tracker.inVisit) and unit['gate'].check(frame)
+        unit['stageTime']['gate'].observe(time.perf_counter()-startT)
+        if not unit['scheduler'].shouldRun(now,motion,tracker.inVisit):
+            for ev in tracker.idle(roi,now):
+                handleEvent(unit,ev)
+            continue
+        unit['now'] = now
+        engine.add(birdCam,roi)
+
+    # one CNN call for all cameras of this tick
+    startT = time.perf_counter()
+    results = engine.run()
+    if len(results)>0:
+        inferTime.observe(time.perf_counter()-startT)
+    for birdCam,roi,species,confidence in results:
+        unit = unitOf[birdCam.sensorId]
+        startT = time.perf_counter()
+        for ev in unit['tracker'].update(roi,species,confidence,unit['now'],prob=birdCam.lastProb):
+            handleEvent(unit,ev)
+        unit['stageTime']['visit'].observe(time.perf_counter()-startT)
+
+    if time.time()-bgTime>1800: # report statistics every half hour
+        bgTime = time.time()
+        print("Shared inference: %.2f images per call"%engine.stats()['meanBatch'])
+
+shutdown()
@@ -10,8 +10,15 @@ import time
 import sys
 import numpy as np
 from birdCam_jetson_ml import *
+from birdCam_gate import motionGate, rateScheduler, resultCache
+from birdCam_upload import uploadQueue
+from birdCam_writer import imageWriter
+from birdCam_visit import visitTracker, wallClock, speciesSmoother
+from birdCam_store import sightingStore
+from birdCam_calib import calibService
+from birdCam_metrics import metricsRegistry, metricsServer
+from birdCam_log import eventLog
 import datetime
-import requests
 
 base_folder = "/home/pichaya/birdCam_ML/"
 output_folder = "/home/pichaya/birdCam_ML/ML06/"
@@ -26,29 +33,6 @@ def terminateProcess(signalNumber, frame):
     print(terminate)
     return
 
-def recordData(filename,data):
-    file = open(filename,'a')
-    file.write(data)
-    file.close()
-
-def uploadFile(filename,url):
-    '''Upload video to server'''
-    headers = requests.utils.default_headers()
-    headers.update(
-        {
-            'User-Agent': 'My User Agent 1.0',
-        }
-    )
-    data = {'password':'******', 'submit':'submit','ftype':'image'}
-    files = {'my_file':(filename, open(filename, 'rb'))}    
-    try:
-        r = requests.post(url, data=data, files=files,headers = headers,timeout=5)
-    except:
-        print("Fail to upload data")
-        return False
-    print(r.text)
-    return r.text=='OK'
-
 def textImage(frame,species,confidence):
     # for putting text
     font = cv2.FONT_HERSHEY_SIMPLEX 
@@ -111,30 +95,116 @@ print("-------BirdCam program----------")
 # initialize output folder
 outputFolderInit(classNum=7)
 
+# upload images in the background; unsent images wait in the spool folder
+uploader = uploadQueue(urlFile,output_folder+'spool/',
+    data={'password':'******', 'submit':'submit','ftype':'image'},
+    headers={'User-Agent': 'My User Agent 1.0'})
+uploader.start()
+
+# save images on worker threads; blank and background images do not need full quality
+# and are the only ones dropped when the queue is full
+writer = imageWriter(workers=1,maxQueue=16,policy='dropOldest',
+    encodeParams={'blankIm/':[cv2.IMWRITE_JPEG_QUALITY,80],'bgimages/':[cv2.IMWRITE_JPEG_QUALITY,80]})
+
 # initialize birdCam
 className = ['Sparrow','Junco','Towhee','Juncojv','Rat','Snail','Blank']
 print("Initializing BirdCam...")
-birdCam = birdCam_trt(model_path,className = className, output_decoder = [6,1,4,5,3,0,2])
+birdCam = birdCam_trt(model_path,className = className, output_decoder = [6,1,4,5,3,0,2],
+    imSetBytes=32e6, imSetJpeg=True) # keep up to 32 MB of JPEG-encoded ROIs per visit
+birdCam.setImageWriter(writer) # writer is flushed by birdCam.terminate()
+# per-frame messages go to a rotating JSON log (replay with birdCam_log.py); visit events also go to the console
+log = eventLog(output_folder+'birdCam.log',level='debug',consoleLevel='info',rateLimit=50)
+birdCam.setLog(log)
 birdCam.initCNN(init_im_path) #initialize CNN model
-birdCam.initCam() #initialize camera (has to be done after CNN initialization)
+birdCam.initCam(poolSize=2) #initialize camera (has to be done after CNN initialization); frames reuse 2 buffers
 #birdCam.initCam(vidFile=base_folder+'1611933860.avi') # program exits if initialization fails
 
 
 lostThresh = 3 # how long can bird gone before counting as new bird in seconds
 picInterval = 0.5 # interval between image storage in seconds
-dataFile = output_folder+"birdCam_ml06.dat"
+dataFile = output_folder+"birdCam_ml06.dat" # flat file of earlier versions
+store = sightingStore(output_folder+"birdCam_ml06.db") # indexed store of all visits
+if os.path.isfile(dataFile):
+    print("Imported %d visits from %s"%(store.importDat(dataFile,output_folder),dataFile))
 first = True # for first run
 
 bgTime = time.time()
 
-blankTime = time.time()
-
 nightTime = False # flag whether it is currently at night
 
+cropCapture = True # crop frames to the ROI inside the gstreamer pipeline after the first calibration
+
 valThresh = 12500
 birdValThresh = 15000
 
-birdCnt = 0 # for counting frames with bird
+# recalibrate the feeder position in the background, only when the scene drifts
+calib = calibService(birdCam,scale=8,checkInterval=10.0,driftThresh=0.9)
+
+# reuse the last CNN output while the ROI stays the same (e.g. a bird sitting still)
+birdCam.setCache(resultCache(capacity=16,hashSize=16,maxBits=6,maxLevel=8.0,ttl=5.0))
+
+# only wake the CNN when the region of interest changes; motion also invalidates the cached results
+gate = motionGate(birdCam,mode='both',valThresh=valThresh,birdValThresh=birdValThresh,holdFrames=30,cache=birdCam.cache)
+
+# classification rate: low while idle, bursts after motion, every frame during a visit
+scheduler = rateScheduler(idleHz=0.5,burstHz=10.0,visitHz=None,burstSec=2.0,targetLatency=2.0)
+
+# visit state machine; replaying a video with a frameClock gives the same decisions as the live camera
+tracker = visitTracker(birdCam,clock=wallClock(),lostThresh=lostThresh,picInterval=picInterval,
+    blankInterval=15*60,smoother=speciesSmoother(len(className),alpha=0.3,decideThresh=0.8,minFrames=3))
+
+# per-stage metrics, served at http://localhost:9108/metrics
+metrics = metricsRegistry()
+stageTime = dict((stage,metrics.histogram('birdcam_stage_seconds','Latency of each stage of the frame loop',labels={'stage':stage}))
+    for stage in ('capture','gate','inference','visit','preprocess','write','upload'))
+birdCam.backend.prep.setLatencyHistogram(stageTime['preprocess']) # per image, inside inference
+writer.setLatencyHistogram(stageTime['write']) # observed on the writer thread
+uploader.setLatencyHistogram(stageTime['upload']) # observed on the upload thread
+framesTotal = metrics.counter('birdcam_frames_total','Frames read from the camera')
+visitsTotal = metrics.counter('birdcam_visits_total','Completed bird visits')
+metrics.addStats('birdcam_capture',birdCam.captureStats) # captured, dropped and stale frames, ring depth
+metrics.addStats('birdcam_backend',birdCam.backend.stats) # preprocessing and predict time
+metrics.addStats('birdcam_gate',gate.stats)
+metrics.addStats('birdcam_cache',birdCam.cache.stats) # hit rate of the result cache
+metrics.addStats('birdcam_scheduler',scheduler.stats)
+metrics.addStats('birdcam_calib',calib.stats)
+metrics.addStats('birdcam_writer',writer.stats) # image write queue depth, drops and write time
+metrics.addStats('birdcam_upload',uploader.stats) # upload queue depth and latency
+metrics.addStats('birdcam_log',log.stats)
+metricsServer(metrics,port=9108).start()
+
+def handleEvent(ev):
+    '''Act on an event from the visit state machine.'''
+    if ev.kind=='arrive':
+        log.info('arrive',species=className[ev.info['species']],confidence=float(ev.info['confidence']))
+        scheduler.arrival(ev.t)
+    elif ev.kind=='early':
+        log.info('early',species=className[ev.info['species']],confidence=float(ev.info['confidence']))
+    elif ev.kind=='picture':
+        log.info('picture',species=className[ev.info['species']],confidence=float(ev.info['confidence']))
+    elif ev.kind=='leaving':
+        log.info('leaving')
+    elif ev.kind=='blank':
+        writer.write(output_folder+'blankIm/%d.jpg'%ev.t,ev.info['roi'])
+    elif ev.kind=='gone':
+        visitsTotal.inc()
+        species_final = ev.info['species']
+        confidence_final = ev.info['confidence']
+        if species_final is None:
+            log.info('gone',species=None,duration=ev.info['duration']) # no valid picture
+            return
+        log.info('gone',species=className[species_final],confidence=float(confidence_final),vote=ev.info['vote'],duration=ev.info['duration'])
+        roi_save = ev.info['roi']
+        imName = output_folder+'bird_%02d/%d.jpg'%(species_final,birdCam.time)
+        writer.write(imName,roi_save,policy='block') # visit records are never dropped
+
+        # record data
+        store.add(birdCam.time,species_final,confidence_final,ev.info['duration'],imName,vote=ev.info['vote'])
+
+        # upload data to server
+        imText = textImage(roi_save,species_final,confidence_final)
+        fname = base_folder+'last_sight.jpg'
+        writer.write(fname,imText,callback=uploader.submit,policy='block') # upload once the file is on disk
 
 #---------- Main Loop of Camera----------------#
 # the main loop runs until SIGINT is received.
@@ -142,28 +212,58 @@ ret_val = True # status of video stream
 fcnt = 0
 while ret_val:
     if terminate:
-        birdCam.terminate()
+        print(gate.stats())
+        print(birdCam.cache.stats())
+        print(calib.stats())
+        calib.stop()
+        print(scheduler.stats())
+        print(uploader.stats())
+        print(writer.stats())
+        print(log.stats())
+        writer.flush() # last images may still queue uploads
+        store.close()
+        uploader.stop()
+        log.close()
+        birdCam.terminate() # closes the image writer
         
+    startT = time.perf_counter()
     ret_val, frame = birdCam.readFrame()
+    stageTime['capture'].observe(time.perf_counter()-startT)
+    framesTotal.inc()
+
+    log.debug('frame',fcnt=birdCam.fcnt)
 
-    print(birdCam.fcnt)
+    if not ret_val:
+        break
 
     if birdCam.fcnt<30: # wait for camera to stabilize
         continue
 
     # calibrate background
     if first:
-        x1,x2 = birdCam.bgCalibrate(frame)
+        x1,x2 = calib.start(frame)
         print("Finished calibrating background")
         cv2.rectangle(frame, (x1, 0), (x2, 719), (255, 0, 0), 2)
-        cv2.imwrite(output_folder+'bgimages/bg_%d.jpg'%time.time(),frame)
+        writer.write(output_folder+'bgimages/bg_%d.jpg'%time.time(),frame)
         first = False
-    elif time.time()-bgTime>1800: # recalibrate background every half hour
-        x1,x2 = birdCam.bgCalibrate(frame)
-        print("Finished calibrating background")
-        cv2.rectangle(frame, (x1, 0), (x2, 719), (255, 0, 0), 2)
-        cv2.imwrite(output_folder+'bgimages/bg_%d.jpg'%time.time(),frame)
+        if cropCapture and birdCam.setCrop(): # from now on the pipeline only converts the ROI
+            continue
+    else:
+        calibFrame = birdCam.fullFrame() if birdCam.cropped else frame # while cropped, full frames come from the tap
+        if calibFrame is not None and calib.check(calibFrame,busy=tracker.inVisit): # feeder moved; new xlim swapped in between visits
+            x1,x2 = birdCam.xlim
+            birdCam.cache.clear() # cached results belong to the old ROI
+            bgim = cv2.rectangle(calibFrame.copy(), (x1, 0), (x2, 719), (255, 0, 0), 2)
+            writer.write(output_folder+'bgimages/bg_%d.jpg'%time.time(),bgim)
+            if birdCam.cropped:
+                birdCam.setCrop() # crop the new ROI in the pipeline
+                continue
+    if time.time()-bgTime>1800: # report statistics every half hour
         bgTime = time.time()
+        print("Calibration: %d checks, %d drifted, %d swaps"%(calib.checks,calib.drifts,calib.swaps))
+        print("Motion gate: %d inferences, %d skipped"%(gate.inferred,gate.skipped))
+        print("Scheduler: %.2f Hz effective, %d late arrivals"%(scheduler.effectiveRate(),scheduler.lateArrivals))
+        print("Upload queue: %d waiting, %.2f s mean latency"%(uploader.depth(),uploader.stats()['meanLatency']))
 
     # check whether it is night time
     # tnow = datetime.datetime.now() # get current time in datetime format
@@ -174,91 +274,22 @@ while ret_val:
 
     # crop image to region of interest only
     roi = birdCam.getRoi(frame)
-    # infer the bird in background
-    species,confidence = birdCam.inference(roi)
 
-    # when bird found in frame, wait for 10 frames to confirm that bird is actually present
-    if birdCam.isBird(species) and birdCnt<10:
-        birdCnt = birdCnt+1
-    elif (time.time()-blankTime)>15*60: # take blank
-        cv2.imwrite(output_folder+'blankIm/%d.jpg'%time.time(),roi)
-        blankTime = time.time()
-    else:
+    # skip the CNN while nothing changes at the feeder; the scheduler sets how often it still runs
+    now = tracker.clock.now()
+    startT = time.perf_counter()
+    motion = (not tracker.inVisit) and gate.check(frame)
+    stageTime['gate'].observe(time.perf_counter()-startT)
+    if not scheduler.shouldRun(now,motion,tracker.inVisit):
+        for ev in tracker.idle(roi,now):
+            handleEvent(ev)
         continue
 
-    print("Found bird!!!")
-    birdCam.updateTime()
-    startT = time.time()
-    lostTime = time.time()
-    lastPicT = time.time()
-    birdCam.resetImSet() # initialize image array
-    birdCam.resetDataArray()
-    birdCam.flags = [True,True,False] #update flags
-    birdCam.appendDataArray(np.array([[species,confidence]])) # append to data array
-
-    #------- Main loop while bird is present at feeder -----------#
-    while(1): 
-        ret_val, frame = birdCam.readFrame() # read new frame
-
-        roi = birdCam.getRoi(frame)
-
-        species,confidence = birdCam.inference(roi)
-
-        if birdCam.isBird(species) and not birdCam.flags[2]: # take first image
-            lastPicT = time.time() # update time image taken
-            print("-----Taking picture--------")
-            birdCam.appendImSet(roi) # add roi to image array
-            birdCam.flags[2] = True # update flag
-            birdCam.appendDataArray(np.array([[species,confidence]])) # append to data array
-
-        elif birdCam.isBird(species) and (time.time()-lastPicT>picInterval): # take new image as time passes
-            print('Still seeing...')
-            lastPicT = time.time() # update time image taken
-            birdCam.appendImSet(roi) # add roi to image array
-            birdCam.flags[1] = True
-            birdCam.appendDataArray(np.array([[species,confidence]])) # append to data array
-
-        elif birdCam.isBird(species): # still seeing bird
-            print('Still seeing...')
-            birdCam.flags[1] = True
-            birdCam.appendDataArray(np.array([[species,confidence]])) # append to data array
-
-        elif birdCam.flags[1]: # bird initially gone from frame
-            print("Bird leaving...")
-            lostTime = time.time()
-            birdCam.flags[1] = False
-
-        elif time.time()-lostTime > lostThresh: # bird gone too long
-            print('Bird gone...')
-            birdCam.resetFlags() # reset flags
-            birdCam.resetFcnt(40)  # reset frame counter
-            birdCnt = 0
-            if birdCam.numImSet()>0:
-                roi_save = birdCam.getImSet(3)
-                # inference
-                species_final,confidence_final = birdCam.modeDataArray() # inference from all images in the set
-                cv2.imwrite(output_folder+'bird_%02d/%d.jpg'%(species_final,birdCam.time),roi_save)
-
-                # record data
-                dataStr = "%d,%d,%.2f,%.2f\n"%(birdCam.time,species_final,confidence,time.time()-birdCam.time)
-                recordData(dataFile,dataStr)
-
-                # upload data to server
-                imText = textImage(roi_save,species,confidence)
-                fname = base_folder+'last_sight.jpg'
-                cv2.imwrite(fname,imText)
-                uploadFile(fname,urlFile)
-            else:
-                print("No valid picture. Skip inference.")
-
-
-            break # end while loop for this detection
-        else:
-            print("Bird still missing...")
-
-
-
-    
-
-
-
+    # infer the bird in background
+    startT = time.perf_counter()
+    species,confidence = birdCam.inference(roi)
+    midT = time.perf_counter()
+    for ev in tracker.update(roi,species,confidence,now,prob=birdCam.lastProb):
+        handleEvent(ev)
+    stageTime['inference'].observe(midT-startT)
+    stageTime['visit'].observe(time.perf_counter()-midT)
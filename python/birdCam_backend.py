@@ -0,0 +1,247 @@
+#!/usr/bin/python
+
+# CNN inference backends for Jetson Nano Bird Camera
+# October 2026
+
+import os
+import abc
+import time
+import cv2
+import numpy as np
+
+
+#-------------General Functions-----------------#
+def createBackend(engine,model_path,maxBatch=16):
+	'''Create an inference backend.
+	engine = 'trt' (TF-TRT saved model), 'tflite', 'onnx' (ONNX Runtime on CPU), 'cvdnn' (OpenCV DNN on CPU)
+	         or 'auto' to choose from the model path.'''
+	if engine=='auto':
+		if os.path.isdir(model_path):
+			engine = 'trt'
+		elif model_path.endswith('.tflite'):
+			engine = 'tflite'
+		else:
+			try:
+				import onnxruntime
+				engine = 'onnx'
+			except ImportError:
+				engine = 'cvdnn'
+	if engine not in BACKENDS:
+		raise ValueError("Unknown inference engine %s"%engine)
+	return BACKENDS[engine](model_path,maxBatch=maxBatch)
+
+
+#-------------Preprocessor Class-----------------#
+class preprocessor():
+	'''Resize BGR images straight into a reusable float32 NHWC input buffer and apply the
+	MobileNetV2 scaling ([0,255] -> [-1,1], same as keras preprocess_input) in place.
+	Buffers are only allocated on construction and when the input size changes (bufferAllocs counts these;
+	memory allocated inside run() itself is measured by birdCam_bench with tracemalloc).'''
+	def __init__(self,imSize=(224,224),maxBatch=16):
+		self.imSize = imSize # input width and height
+		self.maxBatch = maxBatch
+		self.bufferAllocs = 0 # allocations of the input buffers
+		self.frames = 0
+		self.resizeTime = 0.0
+		self.scaleTime = 0.0
+		self.latency = None # birdCam_metrics histogram of the time per image
+		self.allocate()
+
+	def allocate(self):
+		self.resized = np.empty((self.imSize[1],self.imSize[0],3),dtype=np.uint8)
+		self.buffer = np.empty((self.maxBatch,self.imSize[1],self.imSize[0],3),dtype=np.float32)
+		self.bufferAllocs = self.bufferAllocs+1
+
+	def setLatencyHistogram(self,hist):
+		'''Observe the resize and scale time of every image in a birdCam_metrics histogram.'''
+		self.latency = hist
+
+	def setSize(self,imSize):
+		if tuple(imSize)!=tuple(self.imSize):
+			self.imSize = tuple(imSize)
+			self.allocate()
+
+	def run(self,frames):
+		'''Fill the input buffer with up to maxBatch images. Return a view of the filled part,
+		which stays valid until the next call.'''
+		n = len(frames)
+		for k in range(n):
+			startT = time.perf_counter()
+			src = frames[k]
+			if src.shape[1]!=self.imSize[0] or src.shape[0]!=self.imSize[1]:
+				src = cv2.resize(src,self.imSize,dst=self.resized)
+			midT = time.perf_counter()
+			np.multiply(src,1.0/127.5,out=self.buffer[k],dtype=np.float32,casting='unsafe')
+			np.subtract(self.buffer[k],1.0,out=self.buffer[k],dtype=np.float32)
+			endT = time.perf_counter()
+			self.resizeTime = self.resizeTime+midT-startT
+			self.scaleTime = self.scaleTime+endT-midT
+			if self.latency is not None:
+				self.latency.observe(endT-startT)
+		self.frames = self.frames+n
+		return self.buffer[:n]
+
+	def stats(self):
+		n = max(self.frames,1)
+		return {'bufferAllocs':self.bufferAllocs,'frames':self.frames,'resizeTime':self.resizeTime/n,'scaleTime':self.scaleTime/n}
+
+
+#-------------Backend Classes-----------------#
+class inferBackend(abc.ABC):
+	'''Common interface of the inference engines. Subclasses implement load() and predict();
+	a subclass missing one of them cannot be constructed.'''
+	engine = 'none'
+
+	def __init__(self,model_path,maxBatch=16):
+		self.model_path = model_path
+		self.maxBatch = maxBatch # largest number of images per engine call
+		self.imSize = (224,224) # input width and height
+		self.prep = preprocessor(self.imSize,maxBatch)
+		self.calls = 0
+		self.predictTime = 0.0
+		self.loaded = False
+
+	def start(self):
+		'''Load the model once. Later calls, e.g. from other cameras sharing the backend, do nothing.'''
+		if not self.loaded:
+			self.loaded = self.load()
+		return self.loaded
+
+	@abc.abstractmethod
+	def load(self):
+		'''Load the model. Must be called before inference.'''
+
+	@abc.abstractmethod
+	def predict(self,x):
+		'''Run the model on a preprocessed NHWC float32 batch. Return class probabilities of shape (N,classes).'''
+
+	def inputShape(self):
+		return (self.imSize[1],self.imSize[0],3)
+
+	def describe(self):
+		return {'engine':self.engine,'model':self.model_path,'inputShape':self.inputShape(),'maxBatch':self.maxBatch}
+
+	def warmup(self,init_im_path=None):
+		'''Run one inference so that the first frame does not pay for graph building and memory allocation.'''
+		im = None
+		if init_im_path is not None:
+			im = cv2.imread(init_im_path)
+		if im is None:
+			im = np.zeros(self.inputShape(),dtype=np.uint8)
+		print("Start loading inference")
+		startT = time.time()
+		self.inferBatch([im])
+		endT = time.time()
+		print("Finished loading inference in %.2f s"%(endT-startT))
+
+	def inferBatch(self,frames):
+		'''Resize, scale and run a list of BGR images. Return class probabilities of shape (N,classes).'''
+		self.prep.setSize(self.imSize) # engines may only know their input size after load()
+		out = []
+		for k0 in range(0,len(frames),self.maxBatch):
+			x = self.prep.run(frames[k0:k0+self.maxBatch])
+			startT = time.perf_counter()
+			out.append(self.predict(x))
+			self.predictTime = self.predictTime+time.perf_counter()-startT
+			self.calls = self.calls+1
+		if len(out)==1:
+			return out[0]
+		return np.concatenate(out,axis=0)
+
+	def stats(self):
+		'''Input buffer allocations and mean per-stage timings (per image for preprocessing, per call for predict) in s.'''
+		st = self.prep.stats()
+		st['predictTime'] = self.predictTime/max(self.calls,1)
+		st['calls'] = self.calls
+		return st
+
+class trtBackend(inferBackend):
+	'''TensorFlow-TensorRT saved model.'''
+	engine = 'trt'
+
+	def load(self):
+		import tensorflow as tf
+		from tensorflow.python.saved_model import tag_constants
+		self.tf = tf
+		print("Loading TensorRT model. This might take a while...")
+		print("Start loading TRT model %s" %self.model_path)
+		startT = time.time()
+		saved_model_loaded = tf.saved_model.load(self.model_path, tags=[tag_constants.SERVING])
+		endT = time.time()
+		print("Finished loading model in %.2f s"%(endT-startT))
+
+		self.infer = saved_model_loaded.signatures['serving_default']
+		print(self.infer.structured_outputs)
+		self.outputLayer = list(self.infer.structured_outputs.keys())[0]
+		return True
+
+	def predict(self,x):
+		labeling = self.infer(self.tf.constant(x))
+		return labeling[self.outputLayer].numpy()
+
+class tfliteBackend(inferBackend):
+	'''TensorFlow Lite interpreter.'''
+	engine = 'tflite'
+
+	def load(self):
+		import tensorflow as tf
+		print("Load TF Lite model %s"%self.model_path)
+		self.interpreter = tf.lite.Interpreter(model_path=self.model_path)
+		print("Finish loading model.")
+		self.interpreter.allocate_tensors()
+		self.input_details = self.interpreter.get_input_details()
+		self.output_details = self.interpreter.get_output_details()
+		print(self.input_details)
+		print(self.output_details)
+		# NxHxWxC
+		self.imSize = (int(self.input_details[0]['shape'][2]),int(self.input_details[0]['shape'][1]))
+		self.batchSize = int(self.input_details[0]['shape'][0])
+		return True
+
+	def setBatchSize(self,n):
+		'''Resize the interpreter input to a batch of n images. Only reallocates when n changes.'''
+		if n==self.batchSize:
+			return
+		self.interpreter.resize_tensor_input(self.input_details[0]['index'],(n,)+self.inputShape())
+		self.interpreter.allocate_tensors()
+		self.batchSize = n
+
+	def predict(self,x):
+		self.setBatchSize(x.shape[0])
+		self.interpreter.set_tensor(self.input_details[0]['index'], x)
+		self.interpreter.invoke()
+		return self.interpreter.get_tensor(self.output_details[0]['index'])
+
+class onnxBackend(inferBackend):
+	'''ONNX Runtime on the CPU. The model is expected to take NHWC input as exported by tf2onnx.'''
+	engine = 'onnx'
+
+	def load(self):
+		import onnxruntime
+		print("Load ONNX model %s"%self.model_path)
+		self.session = onnxruntime.InferenceSession(self.model_path,providers=['CPUExecutionProvider'])
+		self.inputName = self.session.get_inputs()[0].name
+		shape = self.session.get_inputs()[0].shape
+		if isinstance(shape[1],int) and isinstance(shape[2],int):
+			self.imSize = (shape[2],shape[1])
+		return True
+
+	def predict(self,x):
+		return self.session.run(None,{self.inputName:x})[0]
+
+class cvdnnBackend(inferBackend):
+	'''OpenCV DNN on the CPU, for ONNX models when ONNX Runtime is not installed.'''
+	engine = 'cvdnn'
+
+	def load(self):
+		print("Load OpenCV DNN model %s"%self.model_path)
+		self.net = cv2.dnn.readNet(self.model_path)
+		self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+		self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+		return True
+
+	def predict(self,x):
+		self.net.setInput(x)
+		return self.net.forward()
+
+BACKENDS = {'trt':trtBackend,'tflite':tfliteBackend,'onnx':onnxBackend,'cvdnn':cvdnnBackend}
@@ -0,0 +1,277 @@
+#!/usr/bin/python
+
+# offline replay benchmark of the BirdCam pipeline
+# runs ROI crop, inference, visit logic and image writes from a video file or synthetic frames
+# as fast as possible and reports throughput, per-stage latency and CPU/RSS
+# October 2026
+
+import time
+import argparse
+import os
+import sys
+import json
+import resource
+import tracemalloc
+import tempfile
+import numpy as np
+import cv2
+from birdCam_jetson_ml import birdCam_cnn
+from birdCam_gate import motionGate, resultCache
+from birdCam_writer import imageWriter
+from birdCam_visit import visitTracker, frameClock
+
+# argument parser
+parser = argparse.ArgumentParser(description = "BirdCam offline benchmark")
+parser.add_argument("-m", "--model", type=str,required=True,help="Path to the CNN model")
+parser.add_argument("-e", "--engine", type=str,default="auto",help="Inference engine: auto, trt, tflite, onnx or cvdnn")
+parser.add_argument("-v", "--video", type=str,default=None,help="Recorded video to replay. Synthetic frames are used if not given")
+parser.add_argument("-n", "--frames", type=int,default=1000,help="Maximum number of frames to process")
+parser.add_argument("-b", "--batch", type=int,default=1,help="Number of frames per CNN call")
+parser.add_argument("-g", "--gate", action="store_true",help="Use the motion gate in front of the CNN")
+parser.add_argument("-c", "--cache", action="store_true",help="Reuse CNN results of unchanged ROIs (result cache) and compare the decisions with an uncached run")
+parser.add_argument("--fps", type=float,default=30.0,help="Frame rate of synthetic frames (sets the frame clock)")
+parser.add_argument("-o", "--output", type=str,default=None,help="Folder for images written during the run (temporary folder if not given)")
+parser.add_argument("-j", "--json", type=str,default=None,help="Write the results to this JSON file instead of stdout")
+args = parser.parse_args()
+
+className = ['Sparrow','Junco','Towhee','Juncojv','Rat','Snail','Blank']
+output_decoder = [6,1,4,5,3,0,2]
+
+lostThresh = 3 # how long can bird gone before counting as new bird in seconds
+picInterval = 0.5 # interval between image storage in seconds
+
+
+#-------------Frame Sources-----------------#
+def syntheticFrames(n,imDim=(1280,720)):
+	'''Feeder scene with two dark sensors for calibration and a dark blob that comes and goes.'''
+	w,h = imDim
+	bg = np.full((h,w,3),170,dtype=np.uint8)
+	cv2.rectangle(bg,(int(w*0.3),0),(int(w*0.3)+20,h-1),(20,20,20),-1)
+	cv2.rectangle(bg,(int(w*0.7),0),(int(w*0.7)+20,h-1),(20,20,20),-1)
+	variants = [bg]
+	for k in range(8): # a few bird positions, reused to keep frame generation cheap
+		im = bg.copy()
+		cv2.ellipse(im,(int(w*0.4)+k*20,int(h*0.5)),(90,60),0,0,360,(40,60,90),-1)
+		variants.append(im)
+	for k in range(n):
+		if (k//150)%2==1: # bird present for 5 s out of every 10 s at 30 fps
+			yield variants[1+k%8]
+		else:
+			yield variants[0]
+
+def videoFrames(vidFile,n):
+	cap = cv2.VideoCapture(vidFile)
+	if not cap.isOpened():
+		sys.exit("Unable to open video %s"%vidFile)
+	k = 0
+	while k<n:
+		ret_val, frame = cap.read()
+		if not ret_val or frame is None:
+			break
+		k = k+1
+		yield frame
+	cap.release()
+
+
+#-------------Stage Timer-----------------#
+class stageTimer():
+	'''Collect per-frame latencies of each pipeline stage.'''
+	def __init__(self):
+		self.samples = {}
+
+	def add(self,stage,dt):
+		self.samples.setdefault(stage,[]).append(dt)
+
+	def summary(self):
+		out = {}
+		for stage,dt in self.samples.items():
+			dt = np.array(dt)*1000.0
+			out[stage] = {'n':len(dt),'mean_ms':float(np.mean(dt)),'p50_ms':float(np.percentile(dt,50)),
+				'p95_ms':float(np.percentile(dt,95)),'p99_ms':float(np.percentile(dt,99))}
+		return out
+
+def prepAllocs(prep,roi,n=100):
+	'''Memory allocated by the preprocessor per call, traced with tracemalloc (numpy buffers included,
+	OpenCV's internal allocations are not). peak_kb = largest transient allocation of one call above the
+	steady state, retained_b = bytes kept per call.'''
+	prep.run([roi]) # the input buffers exist before tracing starts
+	tracemalloc.start()
+	base = tracemalloc.get_traced_memory()[0]
+	for k in range(n):
+		prep.run([roi])
+	current,peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	return {'calls':n,'peak_kb':(peak-base)/1e3,'retained_b':(current-base)/float(n)}
+
+def rssMB():
+	'''Current resident set size in MB.'''
+	try:
+		with open('/proc/self/statm') as f:
+			return int(f.read().split()[1])*resource.getpagesize()/1e6
+	except (IOError,OSError):
+		return 0.0
+
+
+#-------------Benchmark-----------------#
+output_folder = args.output if args.output is not None else tempfile.mkdtemp(prefix='birdCam_bench_')
+for k in range(len(className)):
+	if not os.path.isdir(output_folder+"/bird_%.2d"%k):
+		os.makedirs(output_folder+"/bird_%.2d"%k)
+
+birdCam = birdCam_cnn(args.model,engine=args.engine,className=className,output_decoder=output_decoder,maxBatch=args.batch)
+birdCam.verbose = False
+birdCam.initCNN()
+birdCam.backend.warmup()
+writer = imageWriter(workers=1,maxQueue=64,policy='block')
+birdCam.setImageWriter(writer)
+if args.video is not None:
+	fps = cv2.VideoCapture(args.video).get(cv2.CAP_PROP_FPS) or args.fps
+else:
+	fps = args.fps
+
+def replay(useCache,folder):
+	'''Run the pipeline once over the frames, writing visit images to folder.
+	Return a dict of timings, statistics, visits and the per-frame decisions (frame, species).'''
+	frames = videoFrames(args.video,args.frames) if args.video is not None else syntheticFrames(args.frames)
+	cache = resultCache() if useCache else None
+	gate = motionGate(birdCam,cache=cache) if args.gate else None
+	timer = stageTimer()
+	clock = frameClock(fps) # decisions follow frame time, not wall time
+	tracker = visitTracker(birdCam,clock=clock,lostThresh=lostThresh,picInterval=picInterval)
+	visits = []
+	decisions = []
+	pending = [] # (frame number, frame time, roi, fingerprint) waiting for a batched CNN call
+
+	def visitStep(f,t,roi,species,confidence):
+		decisions.append((f,int(species)))
+		for ev in tracker.update(roi,species,confidence,t=t):
+			if ev.kind=='gone' and ev.info['species'] is not None:
+				startT = time.perf_counter()
+				writer.write(folder+'/bird_%02d/%d.jpg'%(ev.info['species'],ev.info['start']*1000),ev.info['roi'])
+				timer.add('write',time.perf_counter()-startT)
+				visits.append({'start':ev.info['start'],'duration':ev.info['duration'],'species':int(ev.info['species']),
+					'confidence':float(ev.info['confidence']),'vote':ev.info['vote']})
+
+	def runBatch():
+		startT = time.perf_counter()
+		y_pred = birdCam.backend.inferBatch([roi for f,t,roi,fp in pending])
+		dt = (time.perf_counter()-startT)/len(pending)
+		for k,(f,t,roi,fp) in enumerate(pending):
+			timer.add('inference',dt)
+			if cache is not None:
+				cache.add(fp,y_pred[k].copy(),t)
+			startT = time.perf_counter()
+			species,confidence = birdCam.decodeProb(y_pred[k])
+			visitStep(f,t,roi,species,confidence)
+			timer.add('visit',time.perf_counter()-startT)
+		del pending[:]
+
+	fcnt = 0
+	roi = None
+	cpu0 = os.times()
+	srtT = time.time()
+	frameT = time.perf_counter()
+	for frame in frames:
+		timer.add('capture',time.perf_counter()-frameT)
+		t = clock.now()
+		clock.advance()
+		if fcnt==0:
+			birdCam.bgCalibrate(frame)
+		fcnt = fcnt+1
+
+		startT = time.perf_counter()
+		roi = birdCam.getRoi(frame)
+		timer.add('roi',time.perf_counter()-startT)
+
+		if gate is not None:
+			startT = time.perf_counter()
+			wake = gate.check(frame)
+			timer.add('gate',time.perf_counter()-startT)
+			if not wake and not tracker.inVisit:
+				frameT = time.perf_counter()
+				continue
+
+		fp = None
+		if cache is not None:
+			startT = time.perf_counter()
+			fp = cache.fingerprint(roi)
+			prob = cache.lookup(fp,t)
+			timer.add('cache',time.perf_counter()-startT)
+			if prob is not None: # unchanged scene; keep the frame order of the visit logic
+				if len(pending)>0:
+					runBatch()
+				startT = time.perf_counter()
+				species,confidence = birdCam.decodeProb(prob)
+				visitStep(fcnt,t,roi,species,confidence)
+				timer.add('visit',time.perf_counter()-startT)
+				frameT = time.perf_counter()
+				continue
+
+		pending.append((fcnt,t,roi,fp))
+		if len(pending)>=args.batch:
+			runBatch()
+		frameT = time.perf_counter()
+	if len(pending)>0:
+		runBatch()
+	startT = time.perf_counter()
+	writer.flush()
+	timer.add('flush',time.perf_counter()-startT)
+	endT = time.time()
+	cpu1 = os.times()
+
+	wall = endT-srtT
+	cpuTime = (cpu1[0]-cpu0[0])+(cpu1[1]-cpu0[1])
+	return {'frames':fcnt,'wall':wall,'cpuTime':cpuTime,'timer':timer,'roi':roi,'visits':visits,'decisions':decisions,
+		'gate_stats':gate.stats() if gate is not None else {},'cache_stats':cache.stats() if cache is not None else {}}
+
+def compareRuns(run,ref):
+	'''Decisions of a cached run that differ from the uncached reference run on the same frames.'''
+	refDecision = dict(ref['decisions'])
+	common = [(f,s) for f,s in run['decisions'] if f in refDecision]
+	changed = [f for f,s in common if s!=refDecision[f]]
+	refVisits = [(v['species'],round(v['start'],3)) for v in ref['visits']]
+	visits = [(v['species'],round(v['start'],3)) for v in run['visits']]
+	return {'reference_fps':ref['frames']/ref['wall'] if ref['wall']>0 else 0.0,'decisions':len(common),
+		'changed_decisions':len(changed),'first_changed_frames':changed[:20],'visits':len(visits),
+		'reference_visits':len(refVisits),'same_visits':visits==refVisits}
+
+run = replay(args.cache,output_folder)
+check = {}
+if args.cache: # the cache must not change what the pipeline decides
+	refFolder = tempfile.mkdtemp(prefix='birdCam_bench_ref_')
+	for k in range(len(className)):
+		os.makedirs(refFolder+"/bird_%.2d"%k)
+	check = compareRuns(run,replay(False,refFolder))
+allocs = prepAllocs(birdCam.backend.prep,run['roi']) if run['frames']>0 else {}
+
+fcnt = run['frames']
+wall = run['wall']
+result = {
+	'engine':birdCam.backend.describe(),
+	'source':args.video if args.video is not None else 'synthetic',
+	'batch':args.batch,
+	'gate':args.gate,
+	'cache':args.cache,
+	'frames':fcnt,
+	'wall_s':wall,
+	'fps':fcnt/wall if wall>0 else 0.0,
+	'cpu_percent':100.0*run['cpuTime']/wall if wall>0 else 0.0,
+	'rss_mb':rssMB(),
+	'max_rss_mb':resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1e3,
+	'stages':run['timer'].summary(),
+	'backend':birdCam.backend.stats(),
+	'prep_allocs':allocs,
+	'gate_stats':run['gate_stats'],
+	'cache_stats':run['cache_stats'],
+	'cache_check':check,
+	'writer':writer.stats(),
+	'visits':run['visits'],
+}
+writer.close()
+
+if args.json is None:
+	print(json.dumps(result,indent=2))
+else:
+	with open(args.json,'w') as f:
+		json.dump(result,f,indent=2)
+	print("Processed %d frames at %.1f fps. Results written to %s"%(fcnt,result['fps'],args.json))
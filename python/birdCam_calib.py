@@ -0,0 +1,202 @@
+#!/usr/bin/python
+
+# background calibration service for Jetson Nano Bird Camera
+# October 2026
+
+import time
+import threading
+import queue
+import cv2
+import numpy as np
+
+
+#-------------Calibration Service Class-----------------#
+class calibService():
+	'''Recalibrate the feeder position only when the scene drifts.
+	Every checkInterval seconds, check() compares the column profile of a downscaled grayscale frame
+	with the profile stored at the last calibration (normalized correlation over shifts of up to
+	maxShift of the width). After confirmChecks drifted checks in a row, the frame is calibrated on a
+	background thread with birdCam.findFeeder(). A new xlim is only accepted when two calibrations
+	in a row agree within agreePx and its width is within widthTol of the current one, so an occluded
+	feeder keeps the old xlim. A rejected calibration backs off (checkInterval doubled per rejection, up to
+	maxBackoff) before the next one. If acceptAfter rejected calibrations in a row agree with each other,
+	the feeder or zoom really changed and that xlim is accepted. The accepted xlim is swapped in by
+	check() on the main thread, between visits.'''
+	def __init__(self,birdCam,scale=8,checkInterval=10.0,driftThresh=0.9,maxShift=0.05,confirmChecks=2,
+			agreePx=8,widthTol=0.3,minShift=4,maxBackoff=600.0,acceptAfter=3):
+		self.birdCam = birdCam
+		self.scale = scale
+		self.checkInterval = checkInterval
+		self.driftThresh = driftThresh
+		self.maxShift = maxShift
+		self.confirmChecks = confirmChecks
+		self.agreePx = agreePx # largest disagreement between two calibrations in pixels
+		self.widthTol = widthTol # largest relative change of the feeder width
+		self.minShift = minShift # smaller changes of xlim (pixels) are not swapped in
+		self.maxBackoff = maxBackoff
+		self.acceptAfter = acceptAfter
+
+		self.refProfile = None
+		self.lastCheck = None
+		self.driftCnt = 0
+		self.candidate = None # last calibration result, waiting for a second one that agrees
+		self.pending = None # (validated xlim, moved) waiting to be swapped in
+		self.outlier = None # last out-of-tolerance xlim and how many rejected calibrations in a row agreed with it
+		self.outlierCnt = 0
+		self.rejectCnt = 0 # rejected calibrations in a row
+		self.holdUntil = 0.0 # no calibration before this check time (backoff after a rejection)
+		self.holdFor = 0.0 # backoff in s set by the worker, turned into holdUntil by check()
+		self.lock = threading.Lock() # guards the state shared with the worker
+		self.busy = False # a calibration is running on the worker
+
+		# statistics
+		self.checks = 0
+		self.drifts = 0
+		self.calibrations = 0
+		self.rejected = 0
+		self.swaps = 0
+		self.checkTime = 0.0
+		self.lastCorr = 1.0
+
+		self.queue = queue.Queue(maxsize=1)
+		self.thread = threading.Thread(target=self._run,name='calibService')
+		self.thread.daemon = True
+		self.thread.start()
+
+	def profile(self,frame):
+		'''Normalized mean column intensity of the downscaled grayscale frame.'''
+		small = cv2.resize(frame,(0,0),fx=1.0/self.scale,fy=1.0/self.scale,interpolation=cv2.INTER_AREA)
+		prof = np.mean(cv2.cvtColor(small,cv2.COLOR_BGR2GRAY),axis=0,dtype=np.float32)
+		prof -= np.mean(prof)
+		std = np.std(prof)
+		if std>0:
+			prof /= std
+		return prof
+
+	def match(self,prof):
+		'''Return the best correlation with the reference profile and its shift in full-frame pixels.'''
+		ref = self.refProfile
+		best,bestShift = -1.0,0
+		for s in range(-int(len(ref)*self.maxShift),int(len(ref)*self.maxShift)+1):
+			if s>=0:
+				corr = np.dot(ref[s:],prof[:len(prof)-s])/(len(ref)-s)
+			else:
+				corr = np.dot(ref[:s],prof[-s:])/(len(ref)+s)
+			if corr>best:
+				best,bestShift = corr,-s
+		return best,bestShift*self.scale
+
+	def start(self,frame):
+		'''Calibrate synchronously on the first frame and store the reference profile.'''
+		xlim = self.birdCam.bgCalibrate(frame)
+		self.refProfile = self.profile(frame)
+		self.lastCheck = time.time()
+		return xlim
+
+	def check(self,frame,t=None,busy=False):
+		'''Call once per frame. busy = True during a visit (no checks, no swaps).
+		Return True if a new xlim was swapped in on this frame.'''
+		if busy or self.refProfile is None:
+			return False
+		if t is None:
+			t = time.time()
+		with self.lock:
+			pending,self.pending = self.pending,None
+		if pending is not None:
+			xlim,moved = pending
+			self.refProfile = self.profile(frame)
+			if moved:
+				self.birdCam.xlim = xlim
+				self.swaps = self.swaps+1
+				print("Background recalibrated: xlim = %d, %d"%tuple(xlim))
+			return moved
+		if t-self.lastCheck<self.checkInterval:
+			return False
+
+		startT = time.perf_counter()
+		self.lastCheck = t
+		self.checks = self.checks+1
+		self.lastCorr,shift = self.match(self.profile(frame))
+		drift = self.lastCorr<self.driftThresh or abs(shift)>=self.minShift
+		with self.lock:
+			if self.holdFor>0:
+				self.holdUntil,self.holdFor = t+self.holdFor,0.0
+			if drift:
+				self.drifts = self.drifts+1
+				self.driftCnt = self.driftCnt+1
+			else:
+				self.driftCnt = 0
+				self.candidate = None
+			start = self.driftCnt>=self.confirmChecks and not self.busy and t>=self.holdUntil
+			if start:
+				self.busy = True
+		if start:
+			self.queue.put(frame.copy())
+		self.checkTime = self.checkTime+time.perf_counter()-startT
+		return False
+
+	def validate(self,xlim):
+		'''Return True if xlim is a plausible feeder position.'''
+		if xlim is None:
+			return False
+		old = self.birdCam.xlim
+		oldWidth = old[1]-old[0]
+		if oldWidth>0 and abs((xlim[1]-xlim[0])-oldWidth)>self.widthTol*oldWidth:
+			return False
+		return True
+
+	def agree(self,a,b):
+		return b is not None and max(abs(a[0]-b[0]),abs(a[1]-b[1]))<=self.agreePx
+
+	def _run(self):
+		while True:
+			frame = self.queue.get()
+			if frame is None: # stop signal
+				break
+			xlim = self.birdCam.findFeeder(frame)
+			with self.lock:
+				self.calibrations = self.calibrations+1
+				self.candidate = self._decide(xlim)
+				self.busy = False
+
+	def _decide(self,xlim):
+		'''Handle one calibration result (called with the lock held). Return the new candidate.'''
+		if xlim is not None and not self.validate(xlim): # out of tolerance: occlusion, or the feeder really changed
+			self.outlierCnt = self.outlierCnt+1 if self.agree(xlim,self.outlier) else 1
+			self.outlier = xlim
+			if self.outlierCnt>=self.acceptAfter:
+				print("Feeder changed: accepting xlim = %d, %d after %d agreeing calibrations"%(xlim[0],xlim[1],self.outlierCnt))
+				self._accept(xlim)
+				return None
+		elif xlim is not None:
+			self.outlier,self.outlierCnt = None,0
+			self.rejectCnt = 0
+			if not self.agree(xlim,self.candidate):
+				return xlim # wait for a second calibration that agrees
+			self._accept(xlim)
+			return None
+		else:
+			self.outlier,self.outlierCnt = None,0
+		self.rejected = self.rejected+1
+		self.rejectCnt = self.rejectCnt+1
+		self.driftCnt = 0
+		self.holdFor = min(self.checkInterval*2**self.rejectCnt,self.maxBackoff)
+		print("Background calibration rejected. Keeping xlim = %d, %d"%tuple(self.birdCam.xlim))
+		return None
+
+	def _accept(self,xlim):
+		self.driftCnt = 0
+		self.rejectCnt = 0
+		self.outlier,self.outlierCnt = None,0
+		old = self.birdCam.xlim
+		moved = max(abs(xlim[0]-old[0]),abs(xlim[1]-old[1]))>=self.minShift
+		self.pending = (xlim,moved) # if the feeder did not move, only the reference profile is refreshed
+
+	def stop(self):
+		self.queue.put(None)
+		self.thread.join(timeout=5)
+
+	def stats(self):
+		'''Checks, drifted checks, calibrations, rejected calibrations, swaps and mean check time in s.'''
+		return {'checks':self.checks,'drifts':self.drifts,'calibrations':self.calibrations,'rejected':self.rejected,
+			'rejectedInRow':self.rejectCnt,'swaps':self.swaps,'checkTime':self.checkTime/max(self.checks,1),'lastCorr':float(self.lastCorr)}
@@ -0,0 +1,274 @@
+#!/usr/bin/python
+
+# inference gating for Jetson Nano Bird Camera
+# October 2026
+
+import time
+import cv2
+import collections
+import numpy as np
+
+
+#-------------Motion Gate Class-----------------#
+class motionGate():
+	'''Cheap pre-check that decides whether the CNN needs to run on a frame.
+	mode = 'otsu' : Otsu threshold sum from birdCam.threshImage() with valThresh/birdValThresh as hysteresis band
+	mode = 'mog2' : MOG2 foreground pixel count on a downscaled ROI
+	mode = 'both' : wake on either signal
+	The gate wakes after wakeFrames consecutive active frames and sleeps again after holdFrames quiet frames.
+	maxSkip > 0 forces one inference after that many skipped frames.
+	cache = resultCache whose entries are invalidated on every frame with motion.'''
+	def __init__(self,birdCam,mode='both',valThresh=12500,birdValThresh=15000,fgThresh=150,scale=4,wakeFrames=1,holdFrames=30,maxSkip=0,cache=None):
+		if mode not in ('otsu','mog2','both'):
+			raise ValueError("Unknown gate mode %s"%mode)
+		self.birdCam = birdCam
+		self.mode = mode
+		self.valThresh = valThresh
+		self.birdValThresh = birdValThresh
+		self.fgThresh = fgThresh
+		self.scale = scale
+		self.wakeFrames = wakeFrames
+		self.holdFrames = holdFrames
+		self.maxSkip = maxSkip
+		self.cache = cache
+
+		self.fgbg = None
+		self.roiShape = None
+		self.reset()
+
+	def reset(self):
+		'''Put the gate to sleep and clear the statistics.'''
+		self.awake = False
+		self.activeCnt = 0 # consecutive frames with motion
+		self.quietCnt = 0 # consecutive frames without motion
+		self.skipRun = 0 # consecutive skipped frames
+		self.val = 0 # last Otsu threshold sum
+		self.fgCnt = 0 # last foreground pixel count
+		self.inferred = 0
+		self.skipped = 0
+
+	def foreground(self,frame):
+		'''Number of MOG2 foreground pixels in the downscaled ROI.'''
+		roi = self.birdCam.getRoi(frame)
+		small = cv2.resize(roi,(0,0),fx=1.0/self.scale,fy=1.0/self.scale,interpolation=cv2.INTER_AREA)
+		if self.fgbg is None or small.shape!=self.roiShape: # ROI changed after background calibration
+			self.fgbg = cv2.createBackgroundSubtractorMOG2(detectShadows=False)
+			self.roiShape = small.shape
+		fgmask = self.fgbg.apply(small)
+		_,mask = cv2.threshold(fgmask,250,255,cv2.THRESH_BINARY)
+		return cv2.countNonZero(mask)
+
+	def check(self,frame):
+		'''Return True if the CNN should run on this frame.'''
+		moving = False
+		if self.mode!='mog2':
+			self.val,_,_ = self.birdCam.threshImage(frame)
+			# once awake, stay awake until the sum falls below the lower threshold
+			moving = self.val>=(self.valThresh if self.awake else self.birdValThresh)
+		if self.mode!='otsu':
+			self.fgCnt = self.foreground(frame)
+			moving = moving or self.fgCnt>=(self.fgThresh/2 if self.awake else self.fgThresh)
+
+		if moving:
+			if self.cache is not None: # results stored before the motion may no longer hold
+				self.cache.invalidate()
+			self.quietCnt = 0
+			self.activeCnt = self.activeCnt+1
+			if self.activeCnt>=self.wakeFrames:
+				self.awake = True
+		else:
+			self.activeCnt = 0
+			if self.awake:
+				self.quietCnt = self.quietCnt+1
+				if self.quietCnt>self.holdFrames:
+					self.awake = False
+
+		if self.awake or (self.maxSkip>0 and self.skipRun>=self.maxSkip):
+			self.inferred = self.inferred+1
+			self.skipRun = 0
+			return True
+		self.skipped = self.skipped+1
+		self.skipRun = self.skipRun+1
+		return False
+
+	def stats(self):
+		total = self.inferred+self.skipped
+		skipRatio = self.skipped/float(total) if total>0 else 0.0
+		return {'inferred':self.inferred,'skipped':self.skipped,'skipRatio':skipRatio,'awake':self.awake}
+
+
+#-------------Rate Scheduler Class-----------------#
+class rateScheduler():
+	'''Choose how often the CNN runs from the current state:
+	idleHz while the feeder is quiet, burstHz for burstSec after motion and visitHz during a visit
+	(None = every frame). Rates are clamped to [minHz,maxHz]. Arrivals detected later than
+	targetLatency after the motion that preceded them are counted as late.'''
+	def __init__(self,idleHz=0.5,burstHz=10.0,visitHz=None,burstSec=2.0,minHz=0.2,maxHz=None,targetLatency=2.0,window=60.0):
+		self.idleHz = idleHz
+		self.burstHz = burstHz
+		self.visitHz = visitHz
+		self.burstSec = burstSec
+		self.minHz = minHz
+		self.maxHz = maxHz
+		self.targetLatency = targetLatency
+		self.window = window # seconds over which the effective rate is measured
+
+		self.lastRun = None
+		self.lastMotion = None
+		self.motionStart = None # start of the current motion episode
+		self.episodeRuns = 0 # inferences during the current motion episode
+		self.runTimes = collections.deque()
+
+		# statistics
+		self.runs = 0
+		self.skipped = 0
+		self.arrivals = 0
+		self.lateArrivals = 0
+		self.missedMotion = 0 # motion episodes that ended without any inference
+		self.latencySum = 0.0
+		self.maxLatency = 0.0
+
+	def clamp(self,hz):
+		if hz is None: # unlimited, only bounded by the ceiling
+			return self.maxHz
+		if self.maxHz is not None:
+			hz = min(hz,self.maxHz)
+		return max(hz,self.minHz)
+
+	def rate(self,t,motion,inVisit):
+		'''Return the classification rate in Hz for this frame (None = every frame).'''
+		if motion:
+			if self.motionStart is None:
+				self.motionStart = t
+				self.episodeRuns = 0
+			self.lastMotion = t
+		if inVisit:
+			return self.clamp(self.visitHz)
+		if self.lastMotion is not None and t-self.lastMotion<=self.burstSec:
+			return self.clamp(self.burstHz)
+		if self.motionStart is not None: # motion episode is over
+			if self.episodeRuns==0:
+				self.missedMotion = self.missedMotion+1
+			self.motionStart = None
+		return self.clamp(self.idleHz)
+
+	def shouldRun(self,t,motion=False,inVisit=False):
+		'''Return True if the CNN should run on the frame at time t.'''
+		hz = self.rate(t,motion,inVisit)
+		if hz is not None and self.lastRun is not None and t-self.lastRun<1.0/hz:
+			self.skipped = self.skipped+1
+			return False
+		self.lastRun = t
+		self.runs = self.runs+1
+		self.episodeRuns = self.episodeRuns+1
+		self.runTimes.append(t)
+		while self.runTimes and t-self.runTimes[0]>self.window:
+			self.runTimes.popleft()
+		return True
+
+	def arrival(self,t):
+		'''Record a visit arrival to measure detection latency from the start of motion.'''
+		latency = t-self.motionStart if self.motionStart is not None else 0.0
+		self.arrivals = self.arrivals+1
+		self.latencySum = self.latencySum+latency
+		self.maxLatency = max(self.maxLatency,latency)
+		if latency>self.targetLatency:
+			self.lateArrivals = self.lateArrivals+1
+
+	def effectiveRate(self):
+		'''Inferences per second over the last `window` seconds.'''
+		if len(self.runTimes)<2:
+			return 0.0
+		span = self.runTimes[-1]-self.runTimes[0]
+		return (len(self.runTimes)-1)/span if span>0 else 0.0
+
+	def stats(self):
+		meanLatency = self.latencySum/self.arrivals if self.arrivals>0 else 0.0
+		return {'runs':self.runs,'skipped':self.skipped,'effectiveHz':self.effectiveRate(),'arrivals':self.arrivals,
+			'lateArrivals':self.lateArrivals,'missedMotion':self.missedMotion,'meanLatency':meanLatency,'maxLatency':self.maxLatency}
+
+
+#-------------Result Cache Class-----------------#
+class resultCache():
+	'''Reuse the CNN output while the ROI has not meaningfully changed (empty feeder, bird sitting still).
+	The fingerprint of a ROI is its hashSize x hashSize grayscale block means. Two fingerprints match when
+	their block-mean hashes (block above the median) differ in at most maxBits bits and no block mean
+	differs by more than maxLevel grey levels, so a small bird changing a few blocks is not matched with
+	the empty feeder. Entries expire ttl seconds after they were stored, so the CNN still runs now and then,
+	and invalidate() (called by the motion gate) drops every entry stored before it. The least recently
+	used entry is evicted when the cache is full.'''
+	def __init__(self,capacity=16,hashSize=16,maxBits=6,maxLevel=8.0,ttl=5.0):
+		self.capacity = capacity
+		self.hashSize = hashSize
+		self.maxBits = maxBits
+		self.maxLevel = maxLevel
+		self.ttl = ttl
+
+		n = hashSize*hashSize
+		self.bits = np.zeros((capacity,n),dtype=bool)
+		self.means = np.zeros((capacity,n),dtype=np.float32)
+		self.stored = np.full(capacity,-np.inf) # time each entry was stored
+		self.used = np.full(capacity,-np.inf) # time each entry was last hit
+		self.gen = np.full(capacity,-1) # generation each entry was stored in
+		self.generation = 0 # bumped by invalidate()
+		self.results = [None]*capacity
+
+		# statistics
+		self.lookups = 0
+		self.hits = 0
+		self.evictions = 0
+		self.invalidations = 0
+
+	def fingerprint(self,roi):
+		'''Block means and block-mean hash of a BGR ROI.'''
+		small = cv2.resize(roi,(self.hashSize,self.hashSize),interpolation=cv2.INTER_AREA)
+		means = cv2.cvtColor(small,cv2.COLOR_BGR2GRAY).astype(np.float32).ravel()
+		return means,means>np.median(means)
+
+	def lookup(self,fp,t=None):
+		'''Return the cached result of a matching scene, or None.'''
+		if t is None:
+			t = time.time()
+		self.lookups = self.lookups+1
+		means,bits = fp
+		valid = (t-self.stored<=self.ttl)&(self.gen==self.generation)
+		if not np.any(valid):
+			return None
+		dist = np.count_nonzero(self.bits!=bits,axis=1)
+		level = np.max(np.abs(self.means-means),axis=1)
+		match = valid&(dist<=self.maxBits)&(level<=self.maxLevel)
+		if not np.any(match):
+			return None
+		k = int(np.argmin(np.where(match,dist,np.iinfo(dist.dtype).max)))
+		self.used[k] = t
+		self.hits = self.hits+1
+		return self.results[k]
+
+	def add(self,fp,result,t=None):
+		'''Store the result of a ROI, replacing an expired or the least recently used entry.'''
+		if t is None:
+			t = time.time()
+		expired = np.nonzero((t-self.stored>self.ttl)|(self.gen!=self.generation))[0]
+		if len(expired)>0:
+			k = int(expired[0])
+		else:
+			k = int(np.argmin(self.used))
+			self.evictions = self.evictions+1
+		self.means[k],self.bits[k] = fp
+		self.stored[k] = self.used[k] = t
+		self.gen[k] = self.generation
+		self.results[k] = result
+
+	def invalidate(self):
+		'''Stop serving the entries stored so far, e.g. because the scene moved.'''
+		self.generation = self.generation+1
+		self.invalidations = self.invalidations+1
+
+	def clear(self):
+		self.stored[:] = -np.inf
+		self.used[:] = -np.inf
+		self.results = [None]*self.capacity
+
+	def stats(self):
+		hitRate = self.hits/float(self.lookups) if self.lookups>0 else 0.0
+		return {'lookups':self.lookups,'hits':self.hits,'hitRate':hitRate,'evictions':self.evictions,'invalidations':self.invalidations}
@@ -10,18 +10,17 @@ import time
 import sys
 import numpy as np
 import datetime
+import glob
+import re
 #from skimage import feature as sk
-import tensorflow as tf
-from tensorflow.keras.preprocessing import image
-from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
-from tensorflow.python.saved_model import tag_constants
-from scipy import stats
+from birdCam_stream import frameReader, framePool
+from birdCam_backend import createBackend
 
 
 
 #-------------General Functions-----------------#
-def gstreamer_pipeline (capture_width=3280, capture_height=2464, display_width=1280, display_height=720, framerate=20, flip_method=0) :   
-    return ('nvarguscamerasrc ! ' 
+def gstreamer_pipeline (capture_width=3280, capture_height=2464, display_width=1280, display_height=720, framerate=20, flip_method=0, sensor_id=0) :   
+    return ('nvarguscamerasrc sensor-id=%d ! ' 
     'video/x-raw(memory:NVMM), '
     'width=(int)%d, height=(int)%d, '
     'format=(string)NV12, framerate=(fraction)%d/1 ! '
@@ -29,15 +28,110 @@ def gstreamer_pipeline (capture_width=3280, capture_height=2464, display_width=1
     'video/x-raw, width=(int)%d, height=(int)%d, format=(string)BGRx ! '
     'videoconvert ! '
     'video/x-raw, format=(string)BGR ! appsink '
-    'max-buffers=60 drop=True'  % (capture_width,capture_height,framerate,flip_method,display_width,display_height))
-
+    'max-buffers=60 drop=True'  % (sensor_id,capture_width,capture_height,framerate,flip_method,display_width,display_height))
+
+def crop_pipeline (xlim, capture_width=1280, capture_height=720, framerate=30, flip_method=0, sensor_id=0, scale=1.0, source='csi', tap_file=None, tap_interval=10) :
+    '''Gstreamer pipeline that only converts the ROI columns xlim[0]:xlim[1] to BGR, scaled by `scale`.
+    source = 'csi' (nvarguscamerasrc, cropped and scaled by nvvidconv in hardware), 'test' (videotestsrc)
+    or a video filename (filesrc), so the pipeline can be tried without a camera.
+    If tap_file (a multifilesink pattern such as /tmp/full_%05d.jpg) is given, one full frame every
+    tap_interval seconds is saved there for background calibration.
+    xlim is in the coordinates of the flipped capture_width x capture_height frame (as seen by the full-frame
+    pipeline), so a csi source is flipped in its own nvvidconv before the crop.'''
+    out_width = int((xlim[1]-xlim[0])*scale)//2*2
+    out_height = int(capture_height*scale)//2*2
+    if source=='csi':
+        src = ('nvarguscamerasrc sensor-id=%d ! '
+        'video/x-raw(memory:NVMM), width=(int)%d, height=(int)%d, format=(string)NV12, framerate=(fraction)%d/1'
+        % (sensor_id,capture_width,capture_height,framerate))
+        if flip_method!=0: # nvvidconv crops in source coordinates, so flip first and crop the flipped frame
+            src = src+(' ! nvvidconv flip-method=%d ! '
+            'video/x-raw(memory:NVMM), width=(int)%d, height=(int)%d, format=(string)NV12'
+            % (flip_method,capture_width,capture_height))
+        crop = ('nvvidconv left=%d right=%d top=0 bottom=%d ! '
+        'video/x-raw, width=(int)%d, height=(int)%d, format=(string)BGRx ! '
+        % (xlim[0],xlim[1],capture_height,out_width,out_height))
+        tap = 'nvvidconv ! video/x-raw, format=(string)I420 ! '
+    else:
+        if source=='test':
+            src = ('videotestsrc is-live=true pattern=ball ! '
+            'video/x-raw, width=(int)%d, height=(int)%d, framerate=(fraction)%d/1' % (capture_width,capture_height,framerate))
+        else:
+            src = 'filesrc location=%s ! decodebin ! videoconvert ! video/x-raw, format=(string)I420'%source
+        crop = ('videocrop left=%d right=%d ! videoscale ! '
+        'video/x-raw, width=(int)%d, height=(int)%d ! '
+        % (xlim[0],capture_width-xlim[1],out_width,out_height))
+        tap = ''
+    sink = 'videoconvert ! video/x-raw, format=(string)BGR ! appsink max-buffers=60 drop=True'
+    if tap_file is None:
+        return src+' ! '+crop+sink
+    return (src+' ! tee name=t '
+    't. ! queue max-size-buffers=2 leaky=downstream ! '+crop+sink+' '
+    't. ! queue max-size-buffers=1 leaky=downstream ! '+tap+
+    'videorate drop-only=true ! video/x-raw, framerate=(fraction)1/%d ! jpegenc ! '
+    'multifilesink location=%s max-files=2' % (tap_interval,tap_file))
+
+
+
+#-------------Data Buffer Class-----------------#
+class dataBuffer():
+	'''Fixed-capacity per-visit buffer of [species,confidence] rows.
+	Keeps the last `capacity` rows in a preallocated ring and running per-class counts and
+	confidence sums over the whole visit, so the mode decision is O(1) and memory is bounded.'''
+	def __init__(self,classNum,capacity=1024):
+		self.classNum = classNum
+		self.capacity = capacity
+		self.rows = np.zeros((capacity,2)) # ring of the most recent rows
+		self.counts = np.zeros(classNum,dtype=np.int64)
+		self.confSum = np.zeros(classNum)
+		self.reset()
+
+	def reset(self):
+		self.counts[:] = 0
+		self.confSum[:] = 0
+		self.n = 0 # total number of rows appended during the visit
+
+	def append(self,species,confidence):
+		species = int(species)
+		self.rows[self.n%self.capacity] = (species,confidence)
+		self.n = self.n+1
+		self.counts[species] = self.counts[species]+1
+		self.confSum[species] = self.confSum[species]+confidence
+
+	def size(self):
+		return self.n
+
+	def recent(self):
+		'''Return the retained rows in order of arrival.'''
+		if self.n<=self.capacity:
+			return self.rows[:self.n].copy()
+		k = self.n%self.capacity
+		return np.concatenate((self.rows[k:],self.rows[:k]))
+
+	def mode(self):
+		'''Return the most frequent species (lowest class number on ties) and its mean confidence.'''
+		species = int(np.argmax(self.counts))
+		if self.counts[species]==0:
+			return self.classNum-1, 0.0
+		return species, self.confSum[species]/self.counts[species]
+
+	def meanConfidence(self,species):
+		'''Return the mean confidence of the rows classified as species, or None if there are none.'''
+		species = int(species)
+		if self.counts[species]==0:
+			return None
+		return self.confSum[species]/self.counts[species]
 
 
 #-------------BirdCam Class-----------------#
 class birdCam():
-	def __init__(self,imDim=(1280,720),fps=30,flip=0, scale=2, thresh=50,maxImSet = 10,className = ['Sparrow','Junco','Towhee','Blank']):
+	def __init__(self,imDim=(1280,720),fps=30,flip=0, scale=2, thresh=50,maxImSet = 10,className = ['Sparrow','Junco','Towhee','Blank'],dataCapacity=1024,imSetBytes=None,imSetJpeg=False,sensorId=0):
 		# Gstreamer pipeline from camera setting
-		self.gstream = gstreamer_pipeline(capture_width=imDim[0], capture_height=imDim[1],framerate=fps,flip_method=flip)
+		self.sensorId = sensorId # CSI sensor of this camera
+		self.imDim = imDim
+		self.fps = fps
+		self.flip = flip
+		self.gstream = gstreamer_pipeline(capture_width=imDim[0], capture_height=imDim[1],framerate=fps,flip_method=flip,sensor_id=sensorId)
 
 		# image processing
 		self.scale = scale
@@ -51,21 +145,47 @@ class birdCam():
 		self.lostTime = time.time()
 		self.bgTime = time.time()
 
-		self.im_array = []
-		self.data_array = np.empty((0,2)) # data array in form [species,confidence] for each row
+		self.im_array = [] # ROI copies (or JPEG buffers) of the current visit
 		self.maxImSet = maxImSet
+		self.imSetBytes = imSetBytes # memory budget of the image set; replaces the maxImSet count if given
+		self.imSetJpeg = imSetJpeg # keep the image set JPEG-encoded in memory
+		self.imSetSize = 0 # bytes used by the image set
 
 		self.className = className
+		self.data_buffer = dataBuffer(len(className),capacity=dataCapacity) # [species,confidence] for each frame of a visit
+		self.reader = None # threaded frame reader, created in initCam
+		self.pool = None # preallocated frame buffers, created in initCam
+		self.lastFrame = None # frame returned by the last readFrame(), released by the next one
+		self.writer = None # background image writer, flushed on terminate
+		self.log = None # birdCam_log.eventLog for per-frame messages
+
+		# cropped capture (see setCrop)
+		self.cropped = False # frames from readFrame() are already the ROI
+		self.cropScale = 1.0
+		self.tapFile = None # full frames for calibration while cropped
+		self.tapTime = 0.0 # modification time of the last full frame returned by fullFrame()
+		self.tapInterval = 10 # seconds between full frames of the tap
+		self.tapCheck = 0.0 # last time fullFrame() looked for a new file
 
 		# flags
 		self.flags = [False,False,False] # feeder_flag, bird_flag, capture_flag
 
-	def initCam(self,vidFile=' '):
+	def initCam(self,vidFile=' ',threaded=False,ringSize=4,policy='latest',poolSize=None):
 		'''
 		Initialize opencv video capture.
 		INPUT: 	vidFile = filename of video to run; if left blank, BirdCam uses gstreamer for capture
+				threaded = if True, frames are captured on a background thread (see birdCam_stream.frameReader)
+				ringSize, policy = size and read policy ('latest' or 'every') of the capture ring
+				poolSize = if given, frames are read into that many preallocated buffers (see birdCam_stream.framePool).
+				           A frame is then only valid until the next readFrame(); keep it longer with
+				           birdCam.pool.addRef(frame) and birdCam.pool.release(frame).
 		OUTPUT: boolean True if successfully open video capture stream
 		'''
+		self.reader = None
+		self.vidFile = vidFile
+		self.capArgs = (threaded,ringSize,policy) # reused when setCrop() rebuilds the capture
+		if poolSize is not None:
+			self.pool = framePool(poolSize)
 		if vidFile==' ': # gstreamer mode
 			print("Initialize gstreamer")
 			print(self.gstream)
@@ -81,14 +201,84 @@ class birdCam():
 			sys.exit("Unable to open camera")
 		else:
 			print("Successfully initialize camera stream.")
+			if threaded:
+				# a video file has no real-time deadline, so the capture thread waits instead of dropping
+				self.reader = frameReader(self.cap,ringSize=ringSize,policy=policy,block=(vidFile!=' '),pool=self.pool).start()
 			return True
 
+	def setCrop(self,scale=1.0,source=None,tapFile='/tmp/birdCam_full_%05d.jpg',tapInterval=10):
+		'''Rebuild the capture so that the pipeline crops the frame to the current xlim (and scales it by `scale`)
+		before the BGR conversion. Call again whenever xlim changes. Full frames for calibration are saved
+		every tapInterval seconds to tapFile and read back with fullFrame().
+		source = 'csi', 'test' or a video filename; by default the source given to initCam().
+		Return False and keep the full-frame capture if the cropped pipeline does not open.'''
+		if source is None:
+			source = 'csi' if self.vidFile==' ' else self.vidFile
+		pipeline = crop_pipeline(self.xlim,capture_width=self.imDim[0],capture_height=self.imDim[1],framerate=self.fps,
+			flip_method=self.flip,sensor_id=self.sensorId,scale=scale,source=source,tap_file=tapFile,tap_interval=tapInterval)
+		print("Initialize cropped gstreamer")
+		print(pipeline)
+		self.release()
+		if tapFile is not None: # full frames of an earlier pipeline
+			for fname in glob.glob(re.sub('%0?[0-9]*d','*',tapFile)):
+				os.remove(fname)
+		self.tapTime = 0.0
+		self.tapInterval = tapInterval
+		self.tapCheck = 0.0
+		self.cap = cv2.VideoCapture(pipeline, cv2.CAP_GSTREAMER)
+		self.cropped = self.cap.isOpened()
+		if not self.cropped:
+			print("Unable to open cropped pipeline. Using full frames.")
+			self.cap = cv2.VideoCapture(self.gstream, cv2.CAP_GSTREAMER) if self.vidFile==' ' else cv2.VideoCapture(self.vidFile)
+		self.cropScale = scale if self.cropped else 1.0
+		self.tapFile = tapFile if self.cropped else None
+		threaded,ringSize,policy = self.capArgs
+		if threaded:
+			self.reader = frameReader(self.cap,ringSize=ringSize,policy=policy,block=(self.vidFile!=' '),pool=self.pool).start()
+		self.resetFcnt(0) # wait for the new pipeline to stabilize
+		return self.cropped
+
+	def fullFrame(self):
+		'''Return the newest complete full frame saved by the calibration tap of a cropped capture,
+		or None if there is no new one. The folder is only listed once every tapInterval seconds.'''
+		if self.tapFile is None:
+			return None
+		now = time.time()
+		if now-self.tapCheck<self.tapInterval:
+			return None
+		files = sorted(glob.glob(re.sub('%0?[0-9]*d','*',self.tapFile)),key=os.path.getmtime)
+		if len(files)<2: # the newest file may still be written
+			return None
+		mtime = os.path.getmtime(files[-2])
+		if mtime<=self.tapTime:
+			return None
+		self.tapCheck = now # the next full frame is tapInterval seconds away
+		self.tapTime = mtime
+		return cv2.imread(files[-2])
+
 	def readFrame(self):
 		'''Read one frame from stream.'''
-		ret_val, frame = self.cap.read()
+		if self.pool is not None and self.lastFrame is not None: # previous frame goes back to the pool
+			self.pool.release(self.lastFrame)
+		if self.reader is not None:
+			ret_val, frame = self.reader.read()
+		elif self.pool is not None:
+			ret_val, frame = self.pool.read(self.cap)
+		else:
+			ret_val, frame = self.cap.read()
+		self.lastFrame = frame
 		self.fcnt = self.fcnt+1
 		return ret_val, frame
 
+	def captureStats(self):
+		'''Return capture statistics (captured, dropped, stale, depth) of the threaded reader
+		and the frame pool statistics (poolFree, poolExhausted).'''
+		if self.reader is not None:
+			return self.reader.stats()
+		if self.pool is not None:
+			return {'poolFree':self.pool.free(),'poolExhausted':self.pool.exhausted}
+		return {}
+
 	def bgCalibrate(self,bgim):
 		'''Calibrate for background position of the feeder.
 		INPUT:
@@ -96,6 +286,16 @@ class birdCam():
 		OUTPUT:
 		min X index = minimum value of x index for cropping
 		max X index = maximum value of x index for cropping.'''
+		xlim = self.findFeeder(bgim)
+		if xlim is None:
+			print("Error calibrating background. Reusing the old background.")
+		else:
+			self.xlim = xlim
+		return self.xlim
+
+	def findFeeder(self,bgim):
+		'''X limits of the feeder in a background image, or None if it is not found.
+		Does not change the state of the birdCam, so it can run on another thread.'''
 		bgimg = cv2.cvtColor(bgim, cv2.COLOR_BGR2GRAY)
 		w = bgimg.shape[1]
 		bgcrop1 = bgimg[:,int(w*0.2):int(w*0.8)]
@@ -103,18 +303,18 @@ class birdCam():
 		se = cv2.getStructuringElement(cv2.MORPH_RECT,(6,6))
 		im_open = cv2.morphologyEx(bgct, cv2.MORPH_OPEN, se)
 		ind = np.nonzero(im_open)
-		try:
-			self.xlim = [np.min(ind[1])+int(w*0.2) ,np.max(ind[1])+int(w*0.2)]
-		except:
-			print("Error calibrating background. Reusing the old background.")
-		return self.xlim
+		if len(ind[1])==0:
+			return None
+		return [int(np.min(ind[1]))+int(w*0.2) ,int(np.max(ind[1]))+int(w*0.2)]
 
 	def getRoi(self,frame):
+		if self.cropped: # the pipeline already delivers the ROI
+			return frame
 		return frame[:,self.xlim[0]:self.xlim[1]]
 
 	def threshImage(self,frame,otsu=True):
 		# crop image to region of interest only
-		roi = frame[:,self.xlim[0]:self.xlim[1]]
+		roi = self.getRoi(frame)
 		roi2 = cv2.resize(roi, (0,0), fx=1.0/self.scale, fy=1.0/self.scale) 
 		# convert to grayscale
 		roig = cv2.cvtColor(roi2, cv2.COLOR_BGR2GRAY)
@@ -134,13 +334,31 @@ class birdCam():
 	def terminate(self):
 		'''Terminate program gracefully. Use with SIGINT.'''
 		print("Starting exit sequence")
+		if self.writer is not None:
+			self.writer.close()
 		time.sleep(1)
-		self.cap.release()
+		self.release()
 		time.sleep(1)
 		print("Finished closing gstream pipeline...")
 		print("Exiting gracefully")
 		sys.exit()
 
+	def release(self):
+		'''Stop the capture of this camera without exiting, e.g. when closing one of several cameras.'''
+		if self.reader is not None:
+			print(self.reader.stats())
+			self.reader.stop()
+			self.reader = None
+		self.cap.release()
+
+	def setLog(self,log):
+		'''Send per-frame messages (e.g. every inference) to a birdCam_log.eventLog instead of the console.'''
+		self.log = log
+
+	def setImageWriter(self,writer):
+		'''Attach a birdCam_writer.imageWriter so that pending images are written on terminate.'''
+		self.writer = writer
+
 	def updateTime(self):
 		self.time = time.time()
 
@@ -152,159 +370,148 @@ class birdCam():
 
 	def resetImSet(self):
 		self.im_array = []
+		self.imSetSize = 0
 
 	def appendImSet(self,frame):
-		if len(self.im_array)<self.maxImSet: # only add frame if the limit is not reached
-			self.im_array.append(frame)
+		'''Add a contiguous copy of the ROI (JPEG-encoded if imSetJpeg), so the full frame it came from can be freed.
+		Return False if the image was not kept because the set is full.'''
+		if self.imSetBytes is None and len(self.im_array)>=self.maxImSet: # only add frame if the limit is not reached
+			return False
+		if self.imSetJpeg:
+			_,im = cv2.imencode('.jpg',frame,[cv2.IMWRITE_JPEG_QUALITY,95])
+		else:
+			im = np.array(frame,order='C',copy=True)
+		if self.imSetBytes is not None and self.imSetSize+im.nbytes>self.imSetBytes:
+			return False
+		self.im_array.append(im)
+		self.imSetSize = self.imSetSize+im.nbytes
+		return True
 
 	def numImSet(self):
 		return len(self.im_array)
 
 	def getImSet(self,n):
+		'''Return image n of the set (the last one if n is out of range), decoded if needed.'''
 		if n>=self.numImSet():
-			return self.im_array[-1]
+			im = self.im_array[-1]
 		else:
-			return self.im_array[n]
+			im = self.im_array[n]
+		if self.imSetJpeg:
+			return cv2.imdecode(im,cv2.IMREAD_COLOR)
+		return im
+
+	def imSetFrames(self):
+		'''Return all images of the set, decoded if needed.'''
+		return [self.getImSet(k) for k in range(self.numImSet())]
 
 	#---------- Data array handler ------------#
 	def resetDataArray(self):
-		self.data_array = np.empty((0,2))
+		self.data_buffer.reset()
 
 	def appendDataArray(self,data):
-		self.data_array = np.append(self.data_array, data, axis=0)
+		'''Append rows of [species,confidence] to the visit buffer.'''
+		for species,confidence in np.reshape(data,(-1,2)):
+			self.data_buffer.append(species,confidence)
 
 	def sizeDataArray(self):
-		return self.data_array.shape[0]
+		return self.data_buffer.size()
 
 	def modeDataArray(self):
-		m = stats.mode(self.data_array[:,0])
-		species = m[0][0]
-		conf = self.data_array[:,1]
-		conf = conf[self.data_array[:,0]==species]
-		confidence = np.mean(conf)
-		return species,confidence
+		return self.data_buffer.mode()
+
+	def confDataArray(self,species):
+		return self.data_buffer.meanConfidence(species)
 
 	def isBird(self,species):
 		return not species==(len(self.className)-1)
 
-class birdCam_trt(birdCam):
-	def __init__(self,model_path,className = ['Sparrow','Junco','Towhee','Blank'],output_decoder = [0,1,2,3]):
+class birdCam_cnn(birdCam):
+	'''BirdCam with a CNN classifier. The inference engine is chosen at startup (see birdCam_backend).
+	Several cameras can share one engine by passing the backend of the first camera to the others.'''
+	def __init__(self,model_path,engine='auto',className = ['Sparrow','Junco','Towhee','Blank'],output_decoder = None,maxBatch=16,imSetBytes=None,imSetJpeg=False,sensorId=0,backend=None):
 		# inheriting properties from the main birdCam
-		birdCam.__init__(self,imDim=(1280,720),fps=30,flip=0, scale=2, thresh=50,maxImSet = 10,className=className)
+		birdCam.__init__(self,imDim=(1280,720),fps=30,flip=0, scale=2, thresh=50,maxImSet = 10,className=className,imSetBytes=imSetBytes,imSetJpeg=imSetJpeg,sensorId=sensorId)
 		self.model_path = model_path
+		if output_decoder is None: # model outputs are already in class order
+			output_decoder = list(range(len(className)))
 		self.output_decoder = output_decoder
+		if backend is None:
+			backend = createBackend(engine,model_path,maxBatch=maxBatch)
+		self.backend = backend
+		self.verbose = True # print every inference (unless a log is set)
+		self.lastProb = np.zeros(len(className),dtype=np.float32) # class probabilities of the last inference()
+		self.cache = None # birdCam_gate.resultCache, set with setCache()
 
 	def initCNN(self,init_im_path=None):
-		'''Initialize TensorFlow CNN model.'''
-		print("Loading TensorRT model. This might take a while...")
-		print("Start loading TRT model %s" %self.model_path)
-		startT = time.time()
-		saved_model_loaded = tf.saved_model.load(self.model_path, tags=[tag_constants.SERVING])
-		endT = time.time()
-		print("Finished loading model in %.2f s"%(endT-startT))
-
-		signature_keys = list(saved_model_loaded.signatures.keys())
-		print(signature_keys)
-
-		self.infer = saved_model_loaded.signatures['serving_default']
-		print(self.infer.structured_outputs)
-		self.outputLayer = list(self.infer.structured_outputs.keys())[0] 
-
-		if init_im_path != None: # if an init image is given, then initialize
-			img = image.load_img(init_im_path, target_size=(224, 224))
-			x = image.img_to_array(img)
-			x = np.expand_dims(x, axis=0)
-			x = preprocess_input(x)
-			x = tf.constant(x)
-			print("Start loading inference")
-			startT = time.time()
-			labeling = self.infer(x)
-			endT = time.time()
-			print("Finished loading inference in %.2f s"%(endT-startT))
-		else:
+		'''Load the CNN model and run one inference to warm it up. A shared model is only loaded once.'''
+		if self.backend.loaded:
+			return True
+		self.backend.start()
+		print(self.backend.describe())
+		if init_im_path is None:
 			print("No init image is given. The model will run slowly the first inference.")
+			return True
+		self.backend.warmup(init_im_path)
 		return True
 
+	def setCache(self,cache):
+		'''Reuse the model output of an unchanged ROI (see birdCam_gate.resultCache).'''
+		self.cache = cache
+
 	def inference(self,frame):
 		'''CNN inference. Return Class Number and confidence.'''
-		x = cv2.resize(frame, (224,224)) 
-		x = np.expand_dims(x, axis=0)
-		x = preprocess_input(x)
-		x = tf.constant(x)
-		labeling = self.infer(x)
-		#y_pred = labeling['predictions'].numpy()
-		y_pred = labeling[self.outputLayer].numpy()
-		ind = np.argmax(y_pred)
+		if self.cache is not None:
+			fp = self.cache.fingerprint(frame)
+			prob = self.cache.lookup(fp)
+			if prob is not None: # same scene as a recent inference
+				return self.decodeProb(prob)
+		y_pred = self.backend.inferBatch([frame])
+		if self.cache is not None:
+			self.cache.add(fp,y_pred[0].copy())
+		return self.decodeProb(y_pred[0])
+
+	def decodeProb(self,prob):
+		'''Decode the model output of one image. Return Class Number and confidence.'''
+		self.lastProb[self.output_decoder] = prob # class probabilities in className order
+		ind = np.argmax(prob)
 		ind2 = self.decodeOutput(ind)
-		print("%.2f - %s: %.2f"%(time.time(),self.className[ind2],y_pred[0][ind]))
-		return ind2,y_pred[0][ind]
+		if self.log is not None:
+			self.log.debug('inference',camera=self.sensorId,species=self.className[ind2],confidence=float(prob[ind]))
+		elif self.verbose:
+			print("%.2f - %s: %.2f"%(time.time(),self.className[ind2],prob[ind]))
+		return ind2,prob[ind]
 
 	def decodeOutput(self,ind):
 		return self.output_decoder[ind]
 
-	def inferSet(self):
-		y_array = np.array([])
-		for im in self.im_array:
-			ind,_ = self.inference(im)
-			y_array = np.append(y_array,ind)
-		m = stats.mode(y_array)
-		print(m)
-		return m[0][0],m[1][0]/len(y_array)
-
-
-class birdCam_tflite(birdCam):
-	def __init__(self,model_path):
-		# inheriting properties from the main birdCam
-		birdCam.__init__(self,imDim=(1280,720),fps=30,flip=0, scale=2, thresh=50,maxImSet = 10)
-		self.model_path = model_path
-
-	def initCNN(self,init_im_path=None):
-		'''Initialize TensorFlow Lite CNN model.'''
-		print("Load TF Lite model %s"%self.model_path)
-		self.interpreter = tf.lite.Interpreter(model_path=self.model_path)
-		print("Finish loading model.")
-		self.interpreter.allocate_tensors()
-
-		self.input_details = self.interpreter.get_input_details()
-		self.output_details = self.interpreter.get_output_details()
-
-		print(self.input_details)
-		print(self.output_details)
-
-		# check the type of the input tensor
-		floating_model = self.input_details[0]['dtype'] == np.float32
-
-		# NxHxWxC, H:1, W:2
-		height = self.input_details[0]['shape'][1]
-		width = self.input_details[0]['shape'][2]
-
-		if init_im_path!=None:
-			im = cv2.imread(init_im_path)
-			self.inference(im)
-			print("Finish loading inference.")
-		else:
-			print("No init image is given. The model will run slowly the first inference.")
-		return True
-
-	def inference(self,frame):
-		'''CNN inference. Return Class Number and confidence.'''
-		x = cv2.resize(frame, (224,224)) 
-		x = np.expand_dims(x, axis=0)
-		x = preprocess_input(x)
-		input_data = tf.constant(x)
-		self.interpreter.set_tensor(self.input_details[0]['index'], input_data)
-		self.interpreter.invoke()
-		output_data = self.interpreter.get_tensor(self.output_details[0]['index'])
-		results = np.squeeze(output_data)
-		ind = np.argmax(results)
-		print("%s: %.2f"%(self.className[ind],results[ind]))
-		return ind,results[ind]
+	def inferBatch(self,frames):
+		'''CNN inference on a list of images, packed into NHWC tensors of up to maxBatch images.
+		Return arrays of class numbers and confidences, one entry per image.'''
+		if len(frames)==0:
+			return np.empty(0,dtype=int),np.empty(0,dtype=np.float32)
+		y_pred = self.backend.inferBatch(frames)
+		ind = np.argmax(y_pred,axis=1)
+		species = np.array(self.output_decoder)[ind]
+		confidence = y_pred[np.arange(len(frames)),ind]
+		return species,confidence
 
 	def inferSet(self):
-		y_array = np.array([])
-		for im in self.im_array:
-			ind,_ = self.inference(im)
-			y_array = np.append(y_array,ind)
-		m = stats.mode(y_array)
-		print(m)
-		return m[0][0],m[1][0]/len(y_array)
+		'''Classify every image of the set. Return the most frequent species (lowest class number on ties)
+		and its share of the images, or (blank, 0.0) for an empty set.'''
+		y_array,_ = self.inferBatch(self.imSetFrames())
+		classNum = len(self.className)
+		if len(y_array)==0:
+			return classNum-1, 0.0
+		counts = np.bincount(y_array.astype(int),minlength=classNum)
+		species = int(np.argmax(counts))
+		return species, float(counts[species])/len(y_array)
+
+class birdCam_trt(birdCam_cnn):
+	def __init__(self,model_path,className = ['Sparrow','Junco','Towhee','Blank'],output_decoder = [0,1,2,3],maxBatch=16,imSetBytes=None,imSetJpeg=False,sensorId=0,backend=None):
+		birdCam_cnn.__init__(self,model_path,engine='trt',className=className,output_decoder=output_decoder,maxBatch=maxBatch,
+			imSetBytes=imSetBytes,imSetJpeg=imSetJpeg,sensorId=sensorId,backend=backend)
+
+class birdCam_tflite(birdCam_cnn):
+	def __init__(self,model_path,className = ['Sparrow','Junco','Towhee','Blank'],output_decoder = None,maxBatch=16,imSetBytes=None,imSetJpeg=False,sensorId=0,backend=None):
+		birdCam_cnn.__init__(self,model_path,engine='tflite',className=className,output_decoder=output_decoder,maxBatch=maxBatch,
+			imSetBytes=imSetBytes,imSetJpeg=imSetJpeg,sensorId=sensorId,backend=backend)
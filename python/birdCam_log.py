@@ -0,0 +1,182 @@
+#!/usr/bin/python
+
+# structured event log for Jetson Nano Bird Camera
+# October 2026
+
+import os
+import time
+import json
+import glob
+import argparse
+import threading
+import collections
+import logging
+import logging.handlers
+
+
+LEVELS = {'debug':10,'info':20,'warning':30,'error':40}
+
+
+#-------------Event Log Class-----------------#
+class eventLog():
+	'''Structured, asynchronous event log for the frame loops.
+	log(level,event,**fields) only appends a tuple to an in-memory ring; the oldest events are dropped
+	when the ring is full. A background thread formats them as JSON lines into a rotating file and prints
+	the ones at or above consoleLevel, so the frame loop never waits on the console or the SD card.
+	Each event name passes at most rateLimit times per second (limits overrides it per event);
+	the number of suppressed events is added to the next one that passes.'''
+	def __init__(self,filename=None,level='info',consoleLevel='info',ringSize=4096,rateLimit=None,limits={},
+			maxBytes=5e6,backupCount=5,flushInterval=1.0):
+		self.filename = filename
+		self.level = LEVELS[level]
+		self.consoleLevel = LEVELS[consoleLevel] if consoleLevel is not None else None
+		self.rateLimit = rateLimit
+		self.limits = limits
+		self.flushInterval = flushInterval
+		self.ring = collections.deque(maxlen=ringSize)
+		self.windows = {} # event -> [window start, events in window, suppressed]
+
+		self.file = None
+		if filename is not None:
+			self.file = logging.getLogger('birdCam.eventLog.%s'%os.path.abspath(filename))
+			self.file.propagate = False
+			self.file.setLevel(logging.DEBUG)
+			handler = logging.handlers.RotatingFileHandler(filename,maxBytes=int(maxBytes),backupCount=backupCount)
+			handler.setFormatter(logging.Formatter('%(message)s'))
+			self.file.addHandler(handler)
+
+		# statistics
+		self.logged = 0
+		self.dropped = 0 # lost to a full ring
+		self.suppressed = 0 # rate limited
+		self.written = 0
+
+		self.running = True
+		self.wake = threading.Event()
+		self.thread = threading.Thread(target=self._run,name='eventLog')
+		self.thread.daemon = True
+		self.thread.start()
+
+	def log(self,level,event,**fields):
+		lvl = LEVELS[level]
+		if lvl<self.level and (self.consoleLevel is None or lvl<self.consoleLevel):
+			return
+		t = time.time()
+		limit = self.limits.get(event,self.rateLimit)
+		if limit is not None:
+			w = self.windows.get(event)
+			if w is None:
+				w = self.windows[event] = [t,0,0]
+			elif t-w[0]>=1.0:
+				w[0],w[1] = t,0
+			w[1] = w[1]+1
+			if w[1]>limit:
+				w[2] = w[2]+1
+				self.suppressed = self.suppressed+1
+				return
+			if w[2]>0:
+				fields['suppressed'] = w[2]
+				w[2] = 0
+		if len(self.ring)==self.ring.maxlen:
+			self.dropped = self.dropped+1
+		self.ring.append((t,lvl,level,event,fields))
+		self.logged = self.logged+1
+		if lvl>=LEVELS['error']:
+			self.wake.set()
+
+	def debug(self,event,**fields):
+		self.log('debug',event,**fields)
+
+	def info(self,event,**fields):
+		self.log('info',event,**fields)
+
+	def warning(self,event,**fields):
+		self.log('warning',event,**fields)
+
+	def error(self,event,**fields):
+		self.log('error',event,**fields)
+
+	def recent(self,n=100):
+		'''Last n events still in the ring (not yet written), as dicts.'''
+		return [eventDict(*e) for e in list(self.ring)[-n:]]
+
+	def _drain(self):
+		while True:
+			try:
+				t,lvl,level,event,fields = self.ring.popleft()
+			except IndexError:
+				break
+			if self.file is not None and lvl>=self.level:
+				self.file.info(json.dumps(eventDict(t,lvl,level,event,fields),default=str))
+				self.written = self.written+1
+			if self.consoleLevel is not None and lvl>=self.consoleLevel:
+				print(formatEvent(eventDict(t,lvl,level,event,fields)))
+
+	def _run(self):
+		while self.running:
+			self.wake.wait(self.flushInterval)
+			self.wake.clear()
+			self._drain()
+		self._drain()
+
+	def flush(self):
+		'''Write everything logged so far (from the calling thread).'''
+		self.wake.set()
+		while len(self.ring)>0 and self.thread.is_alive():
+			time.sleep(0.01)
+
+	def close(self):
+		self.running = False
+		self.wake.set()
+		self.thread.join(timeout=5)
+		if self.file is not None:
+			for handler in self.file.handlers[:]:
+				handler.close()
+				self.file.removeHandler(handler)
+
+	def stats(self):
+		return {'logged':self.logged,'dropped':self.dropped,'suppressed':self.suppressed,'written':self.written,'depth':len(self.ring)}
+
+
+#-------------General Functions-----------------#
+def eventDict(t,lvl,level,event,fields):
+	out = {'t':t,'level':level,'event':event}
+	out.update(fields)
+	return out
+
+def formatEvent(ev):
+	'''One console line: time, level, event and key=value fields.'''
+	fields = ' '.join('%s=%s'%(k,'%.3f'%v if isinstance(v,float) else v) for k,v in ev.items() if k not in ('t','level','event'))
+	return '%.2f %-7s %s %s'%(ev['t'],ev['level'].upper(),ev['event'],fields)
+
+def readLog(filename):
+	'''Yield the events of a log file and its rotated backups, oldest first.'''
+	backups = [f for f in glob.glob(filename+'.*') if f.rsplit('.',1)[1].isdigit()]
+	backups.sort(key=lambda f:int(f.rsplit('.',1)[1]),reverse=True) # birdCam.log.5 is the oldest
+	for fname in backups+[filename]:
+		if not os.path.isfile(fname):
+			continue
+		with open(fname) as f:
+			for line in f:
+				try:
+					yield json.loads(line)
+				except ValueError:
+					continue
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = "Replay a birdCam event log")
+	parser.add_argument("log", type=str,help="Event log file")
+	parser.add_argument("-e", "--event", type=str,nargs='*',default=None,help="Only show these events")
+	parser.add_argument("-l", "--level", type=str,default='debug',help="Lowest level to show")
+	parser.add_argument("-s", "--start", type=float,default=None,help="Only show events after this unix time")
+	args = parser.parse_args()
+
+	for ev in readLog(args.log):
+		if args.event is not None and ev.get('event') not in args.event:
+			continue
+		if LEVELS.get(ev.get('level'),0)<LEVELS[args.level]:
+			continue
+		if args.start is not None and ev.get('t',0)<args.start:
+			continue
+		print(formatEvent(ev))
@@ -0,0 +1,206 @@
+#!/usr/bin/python
+
+# metrics for Jetson Nano Bird Camera
+# counters, gauges and latency histograms served in Prometheus text format over local HTTP
+# October 2026
+
+import re
+import bisect
+import threading
+import socketserver
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+
+# latency buckets in s, from 1 ms to 5 s
+LATENCY_BUCKETS = (0.001,0.002,0.005,0.01,0.02,0.05,0.1,0.2,0.5,1.0,2.0,5.0)
+
+def labelText(labels,extra=None):
+	'''Format a label dict as {a="x",b="y"}.'''
+	items = sorted(labels.items())
+	if extra is not None:
+		items.append(extra)
+	if len(items)==0:
+		return ''
+	return '{'+','.join('%s="%s"'%(k,str(v).replace('\\','\\\\').replace('"','\\"')) for k,v in items)+'}'
+
+def metricName(name):
+	'''Prometheus style name of a stats() key: meanWriteTime -> mean_write_time.'''
+	return re.sub('([a-z0-9])([A-Z])',r'\1_\2',name).lower()
+
+
+#-------------Metric Classes-----------------#
+class counter():
+	'''Monotonic count. inc() is a plain addition, cheap enough for the frame loop.'''
+	kind = 'counter'
+
+	def __init__(self,labels):
+		self.labels = labels
+		self.value = 0
+
+	def inc(self,n=1):
+		self.value = self.value+n
+
+	def samples(self,name):
+		return ['%s%s %s'%(name,labelText(self.labels),repr(float(self.value)))]
+
+class gauge():
+	'''Current value, either set() by the caller or read from fn() when the metrics are scraped.'''
+	kind = 'gauge'
+
+	def __init__(self,labels,fn=None):
+		self.labels = labels
+		self.fn = fn
+		self.value = 0.0
+
+	def set(self,value):
+		self.value = value
+
+	def samples(self,name):
+		value = self.fn() if self.fn is not None else self.value
+		return ['%s%s %s'%(name,labelText(self.labels),repr(float(value)))]
+
+class histogram():
+	'''Latency histogram with fixed buckets. observe() is one bisect and two additions.'''
+	kind = 'histogram'
+
+	def __init__(self,labels,buckets=LATENCY_BUCKETS):
+		self.labels = labels
+		self.buckets = tuple(buckets)
+		self.counts = [0]*(len(self.buckets)+1) # last bin is +Inf
+		self.sum = 0.0
+		self.count = 0
+
+	def observe(self,value):
+		self.counts[bisect.bisect_left(self.buckets,value)] += 1
+		self.sum = self.sum+value
+		self.count = self.count+1
+
+	def samples(self,name):
+		out = []
+		cum = 0
+		for k,le in enumerate(self.buckets):
+			cum = cum+self.counts[k]
+			out.append('%s_bucket%s %d'%(name,labelText(self.labels,('le',repr(float(le)))),cum))
+		out.append('%s_bucket%s %d'%(name,labelText(self.labels,('le','+Inf')),cum+self.counts[-1]))
+		out.append('%s_sum%s %s'%(name,labelText(self.labels),repr(self.sum)))
+		out.append('%s_count%s %d'%(name,labelText(self.labels),self.count))
+		return out
+
+class statsCollector():
+	'''Expose the numeric entries of an existing stats() dict (writer, uploader, capture, ...) as
+	untyped metrics prefix_<key>. stats() is only called when the metrics are scraped.'''
+	kind = 'untyped'
+
+	def __init__(self,labels,fn):
+		self.labels = labels
+		self.fn = fn
+
+	def samples(self,name):
+		out = []
+		for key,value in sorted(self.fn().items()):
+			if isinstance(value,bool):
+				value = int(value)
+			if isinstance(value,(int,float)):
+				out.append('%s_%s%s %s'%(name,metricName(key),labelText(self.labels),repr(float(value))))
+		return out
+
+
+#-------------Metrics Registry Class-----------------#
+class metricsRegistry():
+	'''Named metrics, each with any number of label sets. Asking again for the same name and labels
+	returns the existing metric, so the frame loop can keep a reference and update it directly.'''
+	def __init__(self):
+		self.metrics = {} # name -> (kind, help, {label key: metric})
+		self.lock = threading.Lock()
+
+	def _get(self,cls,name,help,labels,**kw):
+		labels = dict(labels) if labels is not None else {}
+		key = tuple(sorted(labels.items()))
+		with self.lock:
+			if name not in self.metrics:
+				self.metrics[name] = (cls.kind,help,{})
+			kind,_,series = self.metrics[name]
+			if kind!=cls.kind:
+				raise ValueError("Metric %s is already registered as %s"%(name,kind))
+			if key not in series:
+				series[key] = cls(labels,**kw)
+			return series[key]
+
+	def counter(self,name,help='',labels=None):
+		return self._get(counter,name,help,labels)
+
+	def gauge(self,name,help='',labels=None,fn=None):
+		return self._get(gauge,name,help,labels,fn=fn)
+
+	def histogram(self,name,help='',labels=None,buckets=LATENCY_BUCKETS):
+		return self._get(histogram,name,help,labels,buckets=buckets)
+
+	def addStats(self,name,fn,help='',labels=None):
+		'''Publish the numeric entries of fn() (a stats() method) as name_<key>.'''
+		return self._get(statsCollector,name,help,labels,fn=fn)
+
+	def render(self):
+		'''All metrics in Prometheus text exposition format.'''
+		lines = []
+		with self.lock:
+			metrics = [(name,)+self.metrics[name][:2]+(list(self.metrics[name][2].values()),) for name in sorted(self.metrics)]
+		for name,kind,help,series in metrics:
+			if kind!='untyped': # collectors publish several names
+				if help:
+					lines.append('# HELP %s %s'%(name,help))
+				lines.append('# TYPE %s %s'%(name,kind))
+			for metric in series:
+				try:
+					lines.extend(metric.samples(name))
+				except Exception as e: # a failing stats() must not break the endpoint
+					lines.append('# %s: %s'%(name,e))
+		return '\n'.join(lines)+'\n'
+
+
+#-------------Metrics Server Class-----------------#
+class threadingServer(socketserver.ThreadingMixIn,HTTPServer):
+	daemon_threads = True
+
+class metricsServer():
+	'''Serve registry.render() at http://host:port/metrics on a background thread.
+	Binds to localhost by default; use host='0.0.0.0' to let a Prometheus server scrape the unit.'''
+	def __init__(self,registry,port=9108,host='127.0.0.1'):
+		self.registry = registry
+		self.address = (host,port)
+		self.server = None
+		self.thread = None
+
+	def start(self):
+		registry = self.registry
+
+		class handler(BaseHTTPRequestHandler):
+			def do_GET(self):
+				if self.path.split('?')[0] not in ('/metrics','/'):
+					self.send_error(404)
+					return
+				body = registry.render().encode('utf-8')
+				self.send_response(200)
+				self.send_header('Content-Type','text/plain; version=0.0.4; charset=utf-8')
+				self.send_header('Content-Length',str(len(body)))
+				self.end_headers()
+				self.wfile.write(body)
+
+			def log_message(self,format,*args): # keep scrapes out of the console
+				pass
+
+		try:
+			self.server = threadingServer(self.address,handler)
+		except OSError as e: # e.g. the port is taken by another instance; the camera runs without metrics
+			print("Unable to serve metrics at http://%s:%d/metrics: %s"%(self.address+(e,)))
+			return self
+		self.thread = threading.Thread(target=self.server.serve_forever,name='metricsServer')
+		self.thread.daemon = True
+		self.thread.start()
+		print("Serving metrics at http://%s:%d/metrics"%self.address)
+		return self
+
+	def stop(self):
+		if self.server is not None:
+			self.server.shutdown()
+			self.server.server_close()
+			self.server = None
@@ -0,0 +1,59 @@
+#!/usr/bin/python
+
+# shared inference for several cameras on one Jetson Nano Bird Camera
+# October 2026
+
+import time
+
+
+#-------------Shared Inference Class-----------------#
+class sharedInference():
+	'''One CNN engine for several birdCam_cnn cameras created with the same backend.
+	Each tick, add() the ROI of every camera that needs a classification, then run() classifies
+	all of them in a single batch instead of one engine call per camera. ROIs found in a camera's
+	result cache skip the engine.'''
+	def __init__(self,backend):
+		self.backend = backend
+		self.pending = [] # (birdCam, roi, fingerprint, cached output) of the current tick
+
+		# statistics
+		self.ticks = 0
+		self.images = 0
+		self.inferTime = 0.0
+
+	def add(self,cam,roi):
+		if cam.backend is not self.backend:
+			raise ValueError("Camera %d does not use the shared backend"%cam.sensorId)
+		fp,prob = None,None
+		if cam.cache is not None:
+			fp = cam.cache.fingerprint(roi)
+			prob = cam.cache.lookup(fp)
+		self.pending.append((cam,roi,fp,prob))
+
+	def run(self):
+		'''Classify the queued ROIs. Return a list of (birdCam, roi, species, confidence) in the order
+		they were added; each camera's lastProb holds the class probabilities of its ROI.'''
+		if len(self.pending)==0:
+			return []
+		frames = [roi for cam,roi,fp,prob in self.pending if prob is None]
+		if len(frames)>0:
+			startT = time.perf_counter()
+			y_pred = iter(self.backend.inferBatch(frames))
+			self.inferTime = self.inferTime+time.perf_counter()-startT
+			self.ticks = self.ticks+1
+			self.images = self.images+len(frames)
+		out = []
+		for cam,roi,fp,prob in self.pending:
+			if prob is None:
+				prob = next(y_pred)
+				if cam.cache is not None:
+					cam.cache.add(fp,prob.copy())
+			species,confidence = cam.decodeProb(prob)
+			out.append((cam,roi,species,confidence))
+		self.pending = []
+		return out
+
+	def stats(self):
+		'''Batched ticks, classified images, mean batch size and mean time per tick in s.'''
+		n = max(self.ticks,1)
+		return {'ticks':self.ticks,'images':self.images,'meanBatch':self.images/float(n),'tickTime':self.inferTime/n}
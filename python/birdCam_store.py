@@ -0,0 +1,179 @@
+#!/usr/bin/python
+
+# indexed sighting store for Jetson Nano Bird Camera
+# October 2026
+
+import os
+import time
+import sqlite3
+import threading
+import queue
+import argparse
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS visits (
+	id INTEGER PRIMARY KEY,
+	time REAL NOT NULL,
+	species INTEGER NOT NULL,
+	confidence REAL,
+	duration REAL,
+	image TEXT,
+	vote REAL
+);
+CREATE INDEX IF NOT EXISTS visits_time ON visits(time);
+CREATE INDEX IF NOT EXISTS visits_species_time ON visits(species,time);
+'''
+
+FLUSH = 'flush' # queue marker: commit what has been gathered without waiting
+
+
+#-------------Sighting Store Class-----------------#
+class sightingStore():
+	'''SQLite (WAL mode) store of bird visits, indexed on time and species.
+	add() never touches the disk; a background thread commits queued visits in groups
+	of up to groupSize rows, or commitInterval seconds after the first row of a group arrived.
+	A batch that fails to commit is logged and counted in failed; the thread keeps running.'''
+	def __init__(self,filename,groupSize=32,commitInterval=5.0):
+		self.filename = filename
+		self.groupSize = groupSize
+		self.commitInterval = commitInterval
+
+		conn = self.connect()
+		conn.executescript(SCHEMA)
+		columns = [r[1] for r in conn.execute('PRAGMA table_info(visits)')]
+		if 'vote' not in columns: # store created before the vote column
+			conn.execute('ALTER TABLE visits ADD COLUMN vote REAL')
+		conn.commit()
+		conn.close()
+
+		self.queue = queue.Queue()
+		self.written = 0
+		self.failed = 0
+		self.thread = threading.Thread(target=self._run,name='sightingStore')
+		self.thread.daemon = True
+		self.thread.start()
+
+	def connect(self):
+		conn = sqlite3.connect(self.filename,timeout=10)
+		conn.execute('PRAGMA journal_mode=WAL')
+		conn.execute('PRAGMA synchronous=NORMAL')
+		return conn
+
+	def add(self,t,species,confidence,duration,image=None,vote=None):
+		'''Queue one visit for writing. confidence = mean classifier confidence of the species,
+		vote = share of the smoothed species vote (None if the visit was not smoothed).'''
+		self.queue.put((float(t),int(species),float(confidence),float(duration),image,float(vote) if vote is not None else None))
+
+	def _gather(self):
+		'''Wait for a row, then collect rows until the group is full, commitInterval has passed,
+		or a flush or stop marker arrives. Return the queue items.'''
+		items = [self.queue.get()]
+		endT = time.time()+self.commitInterval
+		while len(items)<self.groupSize and items[-1] not in (None,FLUSH):
+			wait = endT-time.time()
+			if wait<=0:
+				break
+			try:
+				items.append(self.queue.get(timeout=wait))
+			except queue.Empty:
+				break
+		return items
+
+	def _run(self):
+		conn = None
+		stop = False
+		while not stop:
+			items = self._gather()
+			stop = None in items # stop signal from close()
+			rows = [r for r in items if r is not None and r is not FLUSH]
+			try:
+				if len(rows)>0:
+					if conn is None:
+						conn = self.connect()
+					with conn:
+						conn.executemany('INSERT INTO visits(time,species,confidence,duration,image,vote) VALUES (?,?,?,?,?,?)',rows)
+					self.written = self.written+len(rows)
+			except sqlite3.Error as e:
+				print("Fail to store %d visits: %s"%(len(rows),e))
+				self.failed = self.failed+len(rows)
+				if conn is not None: # reconnect for the next batch
+					conn.close()
+					conn = None
+			finally:
+				for k in range(len(items)):
+					self.queue.task_done()
+		if conn is not None:
+			conn.close()
+
+	def flush(self):
+		'''Wait until every queued visit is committed.'''
+		self.queue.put(FLUSH)
+		self.queue.join()
+
+	def close(self):
+		self.queue.put(None)
+		self.thread.join(timeout=10)
+
+	#---------- Queries ------------#
+	def visits(self,start=None,end=None,species=None):
+		'''Return (time,species,confidence,duration,image,vote) rows with start <= time < end, in time order.'''
+		sql = 'SELECT time,species,confidence,duration,image,vote FROM visits WHERE time>=? AND time<?'
+		param = [start if start is not None else float('-inf'),end if end is not None else float('inf')]
+		if species is not None:
+			sql = sql+' AND species=?'
+			param.append(int(species))
+		conn = self.connect()
+		rows = conn.execute(sql+' ORDER BY time',param).fetchall()
+		conn.close()
+		return rows
+
+	def countBySpecies(self,start=None,end=None):
+		'''Return {species: (number of visits, first time, last time)} for start <= time < end.'''
+		conn = self.connect()
+		rows = conn.execute('SELECT species,COUNT(*),MIN(time),MAX(time) FROM visits WHERE time>=? AND time<? GROUP BY species',
+			(start if start is not None else float('-inf'),end if end is not None else float('inf'))).fetchall()
+		conn.close()
+		return dict((r[0],r[1:]) for r in rows)
+
+	#---------- Import ------------#
+	def importDat(self,datFile,imageFolder=None):
+		'''Import a birdCam .dat file (time,species,confidence,duration per line).
+		If imageFolder is given, the image path is set to imageFolder/bird_XX/<time>.jpg.
+		Lines already in the store are skipped. Return the number of imported visits.'''
+		rows = []
+		with open(datFile) as f:
+			for line in f:
+				part = line.strip().split(',')
+				if len(part)<4:
+					continue
+				try:
+					t,species,confidence,duration = int(part[0]),int(part[1]),float(part[2]),float(part[3])
+				except ValueError:
+					continue
+				image = None
+				if imageFolder is not None:
+					image = os.path.join(imageFolder,'bird_%02d'%species,'%d.jpg'%t)
+				rows.append((t,species,confidence,duration,image))
+		conn = self.connect()
+		known = set(conn.execute('SELECT CAST(time AS INTEGER),species FROM visits').fetchall())
+		rows = [r for r in rows if (r[0],r[1]) not in known]
+		with conn:
+			conn.executemany('INSERT INTO visits(time,species,confidence,duration,image) VALUES (?,?,?,?,?)',rows)
+		conn.close()
+		return len(rows)
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = "Import birdCam .dat files into a sighting store")
+	parser.add_argument("-d", "--db", type=str,required=True,help="Sighting store database")
+	parser.add_argument("-i", "--images", type=str,default=None,help="Output folder with the bird_XX image folders")
+	parser.add_argument("dat", nargs='+',help=".dat files to import")
+	args = parser.parse_args()
+
+	store = sightingStore(args.db)
+	for datFile in args.dat:
+		startT = time.time()
+		n = store.importDat(datFile,args.images)
+		print("Imported %d visits from %s in %.2f s"%(n,datFile,time.time()-startT))
+	store.close()
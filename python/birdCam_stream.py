@@ -0,0 +1,208 @@
+#!/usr/bin/python
+
+# threaded capture stage for Jetson Nano Bird Camera
+# October 2026
+
+import threading
+import time
+import numpy as np
+
+
+#-------------Frame Pool Class-----------------#
+class framePool():
+	'''Fixed set of preallocated frame buffers that cv2.VideoCapture fills in place.
+	read(cap) leases a free buffer (one reference) and reads into it. Every holder that keeps a frame
+	calls addRef(frame) and later release(frame); the buffer is reused once the last reference is gone.
+	Buffers are allocated from the first frame's shape and again if the stream changes size. When every
+	buffer is held, read() falls back to a normal allocating read and counts the frame as exhausted.
+	release() and addRef() ignore frames that do not belong to the pool, so callers need not check.'''
+	def __init__(self,size=8):
+		self.size = size
+		self.lock = threading.Lock()
+		self.shape = None
+		self.dtype = None
+		self.buffers = [] # preallocated frames
+		self.refs = [] # reference count of each buffer
+		self.index = {} # data pointer -> buffer number
+
+		# statistics
+		self.reads = 0
+		self.exhausted = 0 # reads with every buffer held
+		self.allocs = 0 # buffers allocated
+		self.reshapes = 0 # reallocations after a change of frame size
+
+	def allocate(self,shape,dtype):
+		'''(Re)allocate the buffers for frames of this shape. Buffers still held are left to their holders.'''
+		self.shape = shape
+		self.dtype = dtype
+		self.buffers = [np.empty(shape,dtype=dtype) for k in range(self.size)]
+		self.refs = [0]*self.size
+		self.index = dict((buf.ctypes.data,k) for k,buf in enumerate(self.buffers))
+		self.allocs = self.allocs+self.size
+
+	def lease(self):
+		'''Return a free buffer with one reference, or None if the pool is exhausted or not allocated yet.'''
+		with self.lock:
+			for k in range(len(self.buffers)):
+				if self.refs[k]==0:
+					self.refs[k] = 1
+					return self.buffers[k]
+		return None
+
+	def addRef(self,frame):
+		with self.lock:
+			k = self.index.get(frame.ctypes.data) if frame is not None else None
+			if k is not None:
+				self.refs[k] = self.refs[k]+1
+
+	def release(self,frame):
+		with self.lock:
+			k = self.index.get(frame.ctypes.data) if frame is not None else None
+			if k is not None and self.refs[k]>0:
+				self.refs[k] = self.refs[k]-1
+
+	def read(self,cap):
+		'''cap.read() into a pooled buffer. Return (ret_val, frame); the caller holds one reference.'''
+		self.reads = self.reads+1
+		buf = self.lease()
+		if buf is None:
+			if self.shape is not None:
+				self.exhausted = self.exhausted+1
+			ret_val, frame = cap.read()
+			if ret_val and frame is not None and self.shape is None: # first frame sets the buffer shape
+				with self.lock:
+					self.allocate(frame.shape,frame.dtype)
+			return ret_val, frame
+		ret_val, frame = cap.read(buf)
+		if not ret_val or frame is None:
+			self.release(buf)
+			return ret_val, frame
+		if frame.ctypes.data!=buf.ctypes.data: # stream changed size; OpenCV allocated a new frame
+			self.release(buf)
+			with self.lock:
+				self.reshapes = self.reshapes+1
+				self.allocate(frame.shape,frame.dtype)
+		return ret_val, frame
+
+	def free(self):
+		with self.lock:
+			return self.refs.count(0)
+
+	def stats(self):
+		return {'size':self.size,'free':self.free(),'reads':self.reads,'exhausted':self.exhausted,
+			'allocs':self.allocs,'reshapes':self.reshapes}
+
+
+#-------------Frame Reader Class-----------------#
+class frameReader():
+	'''Drain a cv2.VideoCapture on a background thread into a fixed-size ring.
+	policy = 'latest' : read() returns the newest frame; unread older frames are counted as stale.
+	policy = 'every'  : read() returns frames in capture order; frames arriving on a full ring are counted as dropped
+	                    (or, with block=True, the capture thread waits for the consumer instead).
+	With a framePool, frames are read into pooled buffers; the caller of read() holds one reference
+	and hands it back with release(frame).'''
+	def __init__(self,cap,ringSize=4,policy='latest',block=False,pool=None):
+		if policy not in ('latest','every'):
+			raise ValueError("Unknown frame policy %s"%policy)
+		self.cap = cap
+		self.ringSize = ringSize
+		self.policy = policy
+		self.block = block
+		self.pool = pool
+
+		self.ring = [None]*ringSize
+		self.head = 0 # number of frames written to the ring
+		self.tail = 0 # next frame to hand out ('every' policy)
+		self.lastRead = 0 # sequence number of the last frame handed out ('latest' policy)
+
+		# statistics
+		self.captured = 0
+		self.dropped = 0
+		self.stale = 0
+
+		self.eof = False
+		self.running = False
+		self.cond = threading.Condition()
+		self.thread = None
+
+	def start(self):
+		'''Start the capture thread.'''
+		self.running = True
+		self.thread = threading.Thread(target=self._capture,name='frameReader')
+		self.thread.daemon = True
+		self.thread.start()
+		return self
+
+	def _capture(self):
+		while self.running:
+			if self.pool is not None:
+				ret_val, frame = self.pool.read(self.cap)
+			else:
+				ret_val, frame = self.cap.read()
+			with self.cond:
+				if not ret_val or frame is None: # end of stream or camera failure
+					self.eof = True
+					self.cond.notify_all()
+					return
+				self.captured = self.captured+1
+				if self.policy=='every' and self.head-self.tail>=self.ringSize:
+					if not self.block:
+						self.dropped = self.dropped+1
+						self.release(frame)
+						continue
+					self.cond.wait_for(lambda: self.head-self.tail<self.ringSize or not self.running)
+					if not self.running:
+						return
+				self.release(self.ring[self.head%self.ringSize]) # frame overwritten ('latest' policy)
+				self.ring[self.head%self.ringSize] = frame
+				self.head = self.head+1
+				self.cond.notify_all()
+
+	def read(self,timeout=None):
+		'''Return (ret_val, frame) in the same form as cv2.VideoCapture.read().'''
+		with self.cond:
+			if self.policy=='latest':
+				self.cond.wait_for(lambda: self.head>self.lastRead or self.eof, timeout)
+				if self.head>self.lastRead:
+					self.stale = self.stale+self.head-self.lastRead-1
+					self.lastRead = self.head
+					frame = self.ring[(self.head-1)%self.ringSize]
+					if self.pool is not None: # the frame stays in the ring, so the caller takes its own reference
+						self.pool.addRef(frame)
+					return True, frame
+			else:
+				self.cond.wait_for(lambda: self.head>self.tail or self.eof, timeout)
+				if self.head>self.tail:
+					ind = self.tail%self.ringSize
+					frame = self.ring[ind]
+					self.ring[ind] = None
+					self.tail = self.tail+1
+					self.cond.notify_all()
+					return True, frame
+		return False, None
+
+	def release(self,frame):
+		'''Hand back a frame returned by read() (no-op without a pool).'''
+		if self.pool is not None and frame is not None:
+			self.pool.release(frame)
+
+	def depth(self):
+		'''Number of frames waiting in the ring.'''
+		if self.policy=='latest':
+			return min(self.head-self.lastRead,self.ringSize)
+		return self.head-self.tail
+
+	def stats(self):
+		st = {'captured':self.captured,'dropped':self.dropped,'stale':self.stale,'depth':self.depth()}
+		if self.pool is not None:
+			st['poolFree'] = self.pool.free()
+			st['poolExhausted'] = self.pool.exhausted
+		return st
+
+	def stop(self):
+		'''Stop the capture thread. The video capture itself is left open.'''
+		with self.cond:
+			self.running = False
+			self.cond.notify_all()
+		if self.thread is not None:
+			self.thread.join(timeout=2)
@@ -4,17 +4,30 @@ import time
 import argparse
 import os
 import datetime
+import json
 import numpy as np
 import sys
-import glob
 import pytz
 
+def parseDay(dateStr):
+	try:
+		return datetime.datetime.strptime(dateStr,'%Y-%m-%d').date()
+	except ValueError:
+		raise argparse.ArgumentTypeError("invalid date %s, expected YYYY-MM-DD"%dateStr)
+
 # argument parser
 parser = argparse.ArgumentParser(description = "BirdCam summary script")
 parser.add_argument("-p", "--path", type=str,help="Path to the output folder")
 parser.add_argument("-n", "--classNum", type=int,default=4,help="Number of classes")
+parser.add_argument("-s", "--start", type=parseDay,default=None,help="First day to summarize (YYYY-MM-DD). Default today")
+parser.add_argument("-e", "--end", type=parseDay,default=None,help="Last day to summarize (YYYY-MM-DD). Default same as start")
+parser.add_argument("--hours", action="store_true",help="Print per-hour histograms")
+parser.add_argument("--tz", type=str,default="US/Pacific",help="Time zone of the summary")
+parser.add_argument("--rebuild", action="store_true",help="Ignore the cached index and rescan every folder")
 args = parser.parse_args()
 
+indexName = 'summary_index.json' # cached file index in the output folder
+
 def checkFolder(folder_path,classNum=4):
 	'''Initialize system.'''
 	print("Checking output folder...")
@@ -36,57 +49,139 @@ def checkFolder(folder_path,classNum=4):
 
 def get_pst_time(unaware_dt):
 	now_aware = pytz.utc.localize(unaware_dt)
-	now_aware = now_aware.astimezone(pytz.timezone('US/Pacific'))
+	now_aware = now_aware.astimezone(pytz.timezone(args.tz))
 	return now_aware
 
 def fname2dt(fname):
 	fname = os.path.basename(fname)
 	return int(fname[0:-4])
 
-def extractDataDate(dataSet,target_date):
-	sight = []
-	for fname in dataSet:
-		#print(fname2dt(fname))
-		dt0 = datetime.datetime.utcfromtimestamp(fname2dt(fname))
-		dt0 = get_pst_time(dt0)
-		if dt0.strftime(timeStrFormat) == target_date:
-			sight.append(dt0)
-	return sight
-
-def sortedGlob(path):
-	return sorted(glob.glob(path), key=lambda x: int(os.path.basename(x)[0:-4]))
-
-def folderSummarize(folder,dateStr):
-	'''Summarize the information of the given folder in the given date.'''
-	dataSet = sortedGlob(folder+'*.jpg')
-	sight = extractDataDate(dataSet,dateStr)
-
-	print('--------------------')
-	print(folder)
-
-	if len(sight)==0:
-		print('Total sighting = %d'%len(sight))
-	else:
-		print('Total sighting = %d'%len(sight))
-		print('First sight at %s'%sight[0].strftime('%H:%M'))
-		print('Last sight at %s'%sight[-1].strftime('%H:%M'))
+#---------- File index ------------#
+def loadIndex(folder_path):
+	if args.rebuild:
+		return {}
+	try:
+		with open(folder_path+indexName) as f:
+			return json.load(f)
+	except (IOError,OSError,ValueError):
+		return {}
+
+def saveIndex(folder_path,index):
+	tmpName = folder_path+indexName+'.tmp'
+	with open(tmpName,'w') as f:
+		json.dump(index,f)
+	os.rename(tmpName,folder_path+indexName)
+
+def folderStamps(folder,entry):
+	'''Return the sorted timestamps of the images in a folder and the updated index entry.
+	The entry keeps the timestamp and modification time of every image, so only new or changed
+	files are parsed; nothing is listed if the folder itself did not change since the last run.'''
+	mtime = os.stat(folder).st_mtime
+	if entry is not None and entry.get('mtime')==mtime and 'files' in entry:
+		return np.sort(np.array([v[1] for v in entry['files'].values()],dtype=np.int64)),entry
+	known = entry.get('files',{}) if entry is not None else {}
+	files = {}
+	for f in os.scandir(folder):
+		if not f.name.endswith('.jpg'):
+			continue
+		fmtime = f.stat().st_mtime
+		old = known.get(f.name)
+		if old is not None and old[0]==fmtime: # unchanged image
+			files[f.name] = old
+			continue
+		try:
+			files[f.name] = [fmtime,fname2dt(f.name)]
+		except ValueError:
+			pass
+	stamps = np.sort(np.array([v[1] for v in files.values()],dtype=np.int64))
+	return stamps,{'mtime':mtime,'files':files}
+
+#---------- Vectorized time bucketing ------------#
+def localSeconds(stamps):
+	'''Convert unix timestamps to local seconds since the epoch.
+	The UTC offset is looked up once per distinct hour instead of once per file.'''
+	hours,inv = np.unique(stamps//3600,return_inverse=True)
+	offset = np.array([get_pst_time(datetime.datetime.utcfromtimestamp(int(h)*3600)).utcoffset().total_seconds() for h in hours],dtype=np.int64)
+	return stamps+offset[inv]
+
+def dayNumber(day):
+	return (day-datetime.date(1970,1,1)).days
 
 
 folder_path = args.path
 # get current time
-today = datetime.datetime.now()
-today = get_pst_time(today)
+today = datetime.datetime.utcnow()
+today = get_pst_time(today).date()
 
-timeStrFormat = '%d-%b-%y'
+startDay = args.start if args.start is not None else today
+endDay = args.end if args.end is not None else startDay
+if endDay<startDay:
+	parser.error("--end %s is before --start %s"%(endDay,startDay))
+days = np.arange(dayNumber(startDay),dayNumber(endDay)+1)
 
-tdayStr = today.strftime(timeStrFormat)
+timeStrFormat = '%d-%b-%y'
 
-print("BirdCam Summary of "+tdayStr)
+if startDay==endDay:
+	print("BirdCam Summary of "+startDay.strftime(timeStrFormat))
+else:
+	print("BirdCam Summary from %s to %s"%(startDay.strftime(timeStrFormat),endDay.strftime(timeStrFormat)))
 print('--------------------')
 
 if not checkFolder(folder_path,args.classNum):
 	sys.exit("System exit: Folder not found.")
 
+index = loadIndex(folder_path)
+counts = np.zeros((args.classNum,len(days)),dtype=np.int64) # sightings per species and day
+hourHist = np.zeros((args.classNum,24),dtype=np.int64) # sightings per species and hour of day
+first = {}
+last = {}
+for k in range(args.classNum):
+	name = "bird_%.2d"%k
+	stamps,index[name] = folderStamps(folder_path+name+'/',index.get(name))
+	if len(stamps)==0:
+		continue
+	local = localSeconds(stamps)
+	day = local//86400
+	sel = (day>=days[0])&(day<=days[-1])
+	local = local[sel]
+	day = day[sel]
+	counts[k] = np.bincount(day-days[0],minlength=len(days))
+	hourHist[k] = np.bincount((local%86400)//3600,minlength=24)
+	for d in np.unique(day): # stamps are sorted, so first and last sightings are at the ends
+		ind = np.nonzero(day==d)[0]
+		first[(k,d)] = local[ind[0]]
+		last[(k,d)] = local[ind[-1]]
+saveIndex(folder_path,index)
+
+def hhmm(localSec):
+	return '%02d:%02d'%((localSec%86400)//3600,(localSec%3600)//60)
+
+for n,d in enumerate(days):
+	if len(days)>1:
+		print('====================')
+		print((datetime.date(1970,1,1)+datetime.timedelta(days=int(d))).strftime(timeStrFormat))
+	for k in range(args.classNum):
+		print('--------------------')
+		print(folder_path+"bird_%.2d/"%k)
+		print('Total sighting = %d'%counts[k,n])
+		if counts[k,n]>0:
+			print('First sight at %s'%hhmm(first[(k,d)]))
+			print('Last sight at %s'%hhmm(last[(k,d)]))
+
+print('====================')
+print('Sightings per species')
+total = counts.sum(axis=1)
 for k in range(args.classNum):
-	folder = folder_path+"bird_%.2d/"%k
-	folderSummarize(folder,tdayStr)
+	print('bird_%.2d %6d %s'%(k,total[k],'#'*int(np.ceil(50.0*total[k]/max(total.max(),1)))))
+
+if args.hours:
+	print('====================')
+	print('Sightings per hour')
+	hours = hourHist.sum(axis=0)
+	for h in range(24):
+		print('%02d:00 %6d %s'%(h,hours[h],'#'*int(np.ceil(50.0*hours[h]/max(hours.max(),1)))))
+	for k in range(args.classNum):
+		if total[k]==0:
+			continue
+		print('--------------------')
+		print('bird_%.2d per hour: %s'%(k,' '.join('%d'%c for c in hourHist[k])))
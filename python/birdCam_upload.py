@@ -0,0 +1,268 @@
+#!/usr/bin/python
+
+# background uploader for Jetson Nano Bird Camera
+# October 2026
+
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import threading
+import queue
+import argparse
+import tempfile
+import requests
+
+
+#-------------Upload Queue Class-----------------#
+class uploadQueue():
+	'''Upload files to the server from a background thread.
+	Each submitted file is copied into spoolDir first, so nothing is lost if the upload fails or the
+	program restarts; the spool is replayed by start(). A failed upload stays in the spool and is
+	retried with its own exponential backoff (up to maxBackoff, for as long as it takes), while the
+	entries behind it go ahead. All uploads share one pooled HTTP session. submit() never waits on the network.'''
+	def __init__(self,url,spoolDir,data=None,headers=None,field='my_file',maxQueue=32,timeout=5,backoff=1.0,maxBackoff=300):
+		self.url = url
+		self.spoolDir = spoolDir
+		self.data = dict(data) if data is not None else {} # form fields sent with every file
+		self.field = field # form field of the file
+		self.timeout = timeout
+		self.backoff = backoff
+		self.maxBackoff = maxBackoff
+
+		if not os.path.isdir(spoolDir):
+			os.makedirs(spoolDir)
+
+		# one session keeps the connection to the server alive between uploads
+		self.session = requests.Session()
+		adapter = requests.adapters.HTTPAdapter(pool_connections=1,pool_maxsize=2)
+		self.session.mount('http://',adapter)
+		self.session.mount('https://',adapter)
+		if headers is not None:
+			self.session.headers.update(headers)
+
+		self.queue = queue.Queue(maxsize=maxQueue)
+		self.lock = threading.Lock()
+		self.pending = set() # spool entries currently in the queue
+		self.retry = {} # failed spool entry -> (time of the next attempt, backoff in s)
+		self.spilled = False # True if entries were left in the spool because the queue was full
+		self.seq = 0
+		self.stopEvent = threading.Event()
+		self.thread = None
+
+		# statistics
+		self.sent = 0
+		self.failures = 0
+		self.discarded = 0 # unreadable spool entries
+		self.overflow = 0
+		self.lastLatency = 0.0 # time from submit() to a successful upload in s
+		self.latencySum = 0.0
+		self.lastPostTime = 0.0 # duration of the last successful HTTP request in s
+		self.latency = None # birdCam_metrics histogram of the HTTP request time
+
+	def setLatencyHistogram(self,hist):
+		'''Observe the duration of every upload request (successful or not) in a birdCam_metrics histogram.'''
+		self.latency = hist
+
+	def start(self):
+		'''Queue any uploads left in the spool and start the upload thread.'''
+		self.replaySpool()
+		self.stopEvent.clear()
+		self.thread = threading.Thread(target=self._run,name='uploadQueue')
+		self.thread.daemon = True
+		self.thread.start()
+		return self
+
+	def stop(self,timeout=2):
+		'''Stop the upload thread. Unsent files stay in the spool for the next start().'''
+		self.stopEvent.set()
+		if self.thread is not None:
+			self.thread.join(timeout)
+
+	def submit(self,filename):
+		'''Copy the file into the spool and queue it for upload. Return False if the file cannot be spooled.'''
+		self.seq = self.seq+1
+		base = os.path.join(self.spoolDir,'%d_%04d'%(time.time()*1000,self.seq%10000))
+		try:
+			shutil.copyfile(filename,base+'.dat')
+			with open(base+'.tmp','w') as f:
+				json.dump({'filename':filename,'time':time.time()},f)
+			os.rename(base+'.tmp',base+'.json') # entry only becomes visible once it is complete
+		except (IOError,OSError) as e:
+			print("Fail to spool %s: %s"%(filename,e))
+			return False
+		self._enqueue(base+'.json')
+		return True
+
+	def replaySpool(self):
+		'''Queue spool entries in the order they were submitted.'''
+		for meta in sorted(glob.glob(os.path.join(self.spoolDir,'*.json'))):
+			self._enqueue(meta)
+
+	def _enqueue(self,meta,force=False):
+		with self.lock:
+			if meta in self.pending or (meta in self.retry and not force): # a failed entry waits for its backoff
+				return
+			try:
+				self.queue.put_nowait(meta)
+			except queue.Full: # entry stays in the spool and is picked up once the queue drains
+				self.overflow = self.overflow+1
+				self.spilled = True
+				return
+			self.pending.add(meta)
+
+	def _remove(self,meta):
+		for fname in (meta,meta[:-5]+'.dat'):
+			try:
+				os.remove(fname)
+			except OSError:
+				pass
+
+	def _post(self,meta):
+		'''Upload one spool entry. Return True on success, False to retry and None if the entry is unusable.'''
+		try:
+			with open(meta) as f:
+				info = json.load(f)
+			fdata = open(meta[:-5]+'.dat','rb')
+		except (IOError,OSError,ValueError) as e:
+			print("Invalid spool entry %s: %s"%(meta,e))
+			return None
+		startT = time.time()
+		try:
+			r = self.session.post(self.url,data=self.data,files={self.field:(info['filename'],fdata)},timeout=self.timeout)
+		except requests.exceptions.RequestException as e:
+			print("Fail to upload data: %s"%e)
+			return False
+		finally:
+			fdata.close()
+			if self.latency is not None:
+				self.latency.observe(time.time()-startT)
+		if r.text!='OK':
+			print("Upload rejected: %d %s"%(r.status_code,r.text[:80].strip()))
+			return False
+		endT = time.time()
+		self.lastPostTime = endT-startT
+		self.lastLatency = endT-info.get('time',startT)
+		self.latencySum = self.latencySum+self.lastLatency
+		return True
+
+	def _requeueDue(self):
+		'''Queue the failed entries whose backoff has expired.'''
+		now = time.time()
+		with self.lock:
+			due = sorted(meta for meta,(t,delay) in self.retry.items() if t<=now)
+		for meta in due:
+			self._enqueue(meta,force=True)
+
+	def _run(self):
+		while not self.stopEvent.is_set():
+			self._requeueDue()
+			try:
+				meta = self.queue.get(timeout=0.5)
+			except queue.Empty:
+				if self.spilled:
+					self.spilled = False
+					self.replaySpool()
+				continue
+
+			ok = self._post(meta)
+			with self.lock:
+				self.pending.discard(meta)
+				if ok:
+					self.sent = self.sent+1
+					self.retry.pop(meta,None)
+				elif ok is None:
+					self.discarded = self.discarded+1
+					self.retry.pop(meta,None)
+				else: # keep the entry in the spool and try again after its backoff
+					self.failures = self.failures+1
+					t,delay = self.retry.get(meta,(0,self.backoff/2.0))
+					delay = min(delay*2,self.maxBackoff)
+					self.retry[meta] = (time.time()+delay,delay)
+			if ok is False:
+				self.stopEvent.wait(self.backoff) # do not hammer a server that is down with the next entries
+			else:
+				self._remove(meta)
+
+	def depth(self):
+		return self.queue.qsize()
+
+	def stats(self):
+		meanLatency = self.latencySum/self.sent if self.sent>0 else 0.0
+		return {'depth':self.depth(),'sent':self.sent,'failures':self.failures,'discarded':self.discarded,'retrying':len(self.retry),
+			'overflow':self.overflow,'lastLatency':self.lastLatency,'meanLatency':meanLatency,'lastPostTime':self.lastPostTime}
+
+
+#-------------Stand-in Server-----------------#
+def standinServer(port=0,failFirst=0,reject=()):
+	'''Local HTTP server that answers like the upload server: "OK" to a multipart POST, after failing
+	the first failFirst requests with a 503 and always rejecting files whose name contains one of reject.
+	Return the server; server.received lists the uploaded file names. Serve it with serve_forever().'''
+	from http.server import HTTPServer, BaseHTTPRequestHandler
+
+	class handler(BaseHTTPRequestHandler):
+		def do_POST(self):
+			body = self.rfile.read(int(self.headers.get('Content-Length',0)))
+			server.requests = server.requests+1
+			if server.requests<=failFirst:
+				self.send_error(503)
+				return
+			name = body.split(b'filename="',1)[-1].split(b'"',1)[0].decode('utf-8','replace')
+			text = b'OK'
+			if any(r in name for r in reject):
+				text = b'rejected'
+			else:
+				server.received.append(name)
+			self.send_response(200)
+			self.send_header('Content-Length',str(len(text)))
+			self.end_headers()
+			self.wfile.write(text)
+
+		def log_message(self,format,*args):
+			pass
+
+	server = HTTPServer(('127.0.0.1',port),handler)
+	server.requests = 0
+	server.received = []
+	return server
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = "Check the upload queue against a local stand-in server")
+	parser.add_argument("-n", "--files", type=int,default=5,help="Number of files to upload")
+	parser.add_argument("-f", "--fail", type=int,default=3,help="Requests the server fails before it comes up")
+	parser.add_argument("-t", "--timeout", type=float,default=30,help="Seconds to wait for the uploads")
+	args = parser.parse_args()
+
+	server = standinServer(failFirst=args.fail,reject=('bad',))
+	serverThread = threading.Thread(target=server.serve_forever)
+	serverThread.daemon = True
+	serverThread.start()
+	url = 'http://127.0.0.1:%d/upload'%server.server_address[1]
+
+	folder = tempfile.mkdtemp()
+	spool = os.path.join(folder,'spool')
+	uploader = uploadQueue(url,spool,backoff=0.2,maxBackoff=1.0).start()
+	names = ['bad_000.jpg']+['bird_%03d.jpg'%k for k in range(args.files)]
+	for name in names:
+		fname = os.path.join(folder,name)
+		with open(fname,'wb') as f:
+			f.write(os.urandom(1024))
+		uploader.submit(fname)
+
+	endT = time.time()+args.timeout
+	while time.time()<endT and len(set(server.received))<args.files:
+		time.sleep(0.1)
+	uploader.stop()
+	server.shutdown()
+
+	good = sorted(set(os.path.basename(n) for n in server.received))
+	left = [os.path.basename(f) for f in glob.glob(os.path.join(spool,'*.json'))]
+	print(uploader.stats())
+	print("Uploaded %d of %d files after %d requests, %d entries left in the spool"%(len(good),args.files,server.requests,len(left)))
+	ok = good==names[1:] and len(left)==1 # the rejected file is kept for retry
+	shutil.rmtree(folder)
+	print("PASS" if ok else "FAIL")
+	sys.exit(0 if ok else 1)
@@ -0,0 +1,300 @@
+#!/usr/bin/python
+
+# visit state machine for Jetson Nano Bird Camera
+# October 2026
+
+import time
+import sys
+import argparse
+import cv2
+import numpy as np
+
+
+#-------------Clocks-----------------#
+class wallClock():
+	'''Wall clock time for live cameras.'''
+	def now(self):
+		return time.time()
+
+	def advance(self):
+		pass
+
+class frameClock():
+	'''Frame time for recorded footage: start + frame count/fps. Call advance() once per frame.'''
+	def __init__(self,fps=30.0,start=0.0):
+		self.fps = float(fps)
+		self.start = start
+		self.n = 0
+
+	def now(self):
+		return self.start+self.n/self.fps
+
+	def advance(self):
+		self.n = self.n+1
+
+class captureClock():
+	'''Presentation timestamp of the last frame read from an (unthreaded) cv2.VideoCapture.'''
+	def __init__(self,cap,start=0.0):
+		self.cap = cap
+		self.start = start
+
+	def now(self):
+		return self.start+self.cap.get(cv2.CAP_PROP_POS_MSEC)/1000.0
+
+	def advance(self):
+		pass
+
+
+#-------------Visit Event Class-----------------#
+class visitEvent():
+	'''Event emitted by visitTracker.
+	kind = 'arrive', 'early', 'picture', 'leaving', 'gone', 'deterOn', 'deterOff' or 'blank'.'''
+	def __init__(self,kind,t,**info):
+		self.kind = kind
+		self.t = t
+		self.info = info
+
+	def __repr__(self):
+		return "visitEvent(%s,%.2f)"%(self.kind,self.t)
+
+
+#-------------Species Smoother Class-----------------#
+class speciesSmoother():
+	'''Online temporal classifier over per-frame class probabilities.
+	The running posterior is a confidence-weighted exponential moving average: frames with a
+	confident prediction move it by up to alpha, uncertain transition frames move it less.
+	update() returns a class once its posterior crosses decideThresh (after minFrames frames),
+	and again whenever the decided class changes. final() soft-votes over the whole visit.
+	From the uniform start, alpha=0.3 and decideThresh=0.8 need 5 frames at confidence 1.0 (6 at 0.95) for a decision.'''
+	def __init__(self,classNum,blankClass=None,alpha=0.3,decideThresh=0.8,minFrames=3):
+		self.classNum = classNum
+		self.blankClass = blankClass if blankClass is not None else classNum-1
+		self.alpha = alpha
+		self.decideThresh = decideThresh
+		self.minFrames = minFrames
+		self.posterior = np.zeros(classNum)
+		self.votes = np.zeros(classNum)
+		self.probSum = np.zeros(classNum)
+		self.reset()
+
+	def reset(self):
+		self.posterior[:] = 1.0/self.classNum
+		self.votes[:] = 0
+		self.probSum[:] = 0
+		self.frames = 0
+		self.decision = None
+
+	def update(self,prob):
+		'''Add the class probabilities of one frame. Return the newly decided class or None.'''
+		prob = np.asarray(prob,dtype=np.float64)
+		w = self.alpha*np.max(prob)
+		self.posterior *= 1.0-w
+		self.posterior += w*prob
+		self.posterior /= np.sum(self.posterior)
+		self.votes += np.max(prob)*prob
+		self.probSum += prob
+		self.frames = self.frames+1
+
+		ind = int(np.argmax(self.posterior))
+		if self.frames<self.minFrames or self.posterior[ind]<self.decideThresh or ind==self.blankClass:
+			return None
+		if ind==self.decision:
+			return None
+		self.decision = ind
+		return ind
+
+	def final(self):
+		'''Return the soft-voted species of the visit (ignoring blank) and its share of the votes, or (None,0).'''
+		votes = self.votes.copy()
+		votes[self.blankClass] = 0
+		if np.sum(votes)<=0:
+			return None,0.0
+		ind = int(np.argmax(votes))
+		return ind,votes[ind]/np.sum(votes)
+
+	def meanProb(self,ind):
+		'''Mean probability of class ind over the frames of the visit.'''
+		return self.probSum[ind]/max(self.frames,1)
+
+
+#-------------Visit Tracker Class-----------------#
+class visitTracker():
+	'''Bird visit state machine of the main loop. Feed it one timestamped inference result per frame
+	with update(); it keeps the image set and data array of the birdCam and returns a list of visitEvents.
+	Time comes from the clock, so recorded footage gives the same decisions as the live camera.
+	With a speciesSmoother, update() also takes the class probabilities of the frame: an 'early' event
+	is emitted as soon as a species is decided and the final species of the visit is the smoother's soft vote.
+	The rat deterrent keeps its frame counter (ratCntThresh rat frames) as the fast path; an early rat
+	decision can only turn it on sooner, never later. The gone event keeps the mean classifier
+	confidence of that species in confidence and adds the vote share in vote (None without a smoother).'''
+	def __init__(self,birdCam,clock=None,lostThresh=3,picInterval=0.5,confirmFrames=1,ratClass=5,ratCntThresh=3,blankInterval=15*60,smoother=None):
+		self.birdCam = birdCam
+		self.clock = clock if clock is not None else wallClock()
+		self.lostThresh = lostThresh # how long can bird gone before counting as new bird in seconds
+		self.picInterval = picInterval # interval between image storage in seconds
+		self.confirmFrames = confirmFrames # frames with a bird before a visit starts
+		self.ratClass = ratClass
+		self.ratCntThresh = ratCntThresh # frames with a rat before the deterrent turns on
+		self.blankInterval = blankInterval # interval between blank images in seconds
+		self.smoother = smoother
+
+		self.inVisit = False
+		self.birdCnt = 0
+		self.ratCnt = 0
+		self.deterrent = False
+		self.lostTime = self.lastPicT = self.startT = 0.0
+		self.blankTime = self.clock.now()
+
+	def idle(self,roi,t=None):
+		'''Frame without inference (e.g. skipped by the motion gate). Only takes blank images.'''
+		if t is None:
+			t = self.clock.now()
+		return self.checkBlank(roi,t,[])
+
+	def checkBlank(self,roi,t,events):
+		if t-self.blankTime>self.blankInterval:
+			self.blankTime = t
+			events.append(visitEvent('blank',t,roi=roi))
+		return events
+
+	def update(self,roi,species,confidence,t=None,prob=None):
+		'''Process one inference result. Return the list of events of this frame.'''
+		if t is None:
+			t = self.clock.now()
+		events = []
+		isBird = self.birdCam.isBird(species)
+
+		if not self.inVisit:
+			# count frames with a bird to confirm that bird is actually present
+			self.birdCnt = self.birdCnt+1 if isBird else 0
+			if self.birdCnt<self.confirmFrames:
+				return self.checkBlank(roi,t,events)
+			self.startVisit(species,confidence,t)
+			events.append(visitEvent('arrive',t,species=species,confidence=confidence))
+			self.smooth(prob,t,events)
+			return events
+
+		if species==self.ratClass and confidence>0.4:
+			self.ratCnt = self.ratCnt+1
+		# reset rat counter if other species is found instead
+		if species!=self.ratClass and confidence>0.3:
+			self.ratCnt = 0
+		self.smooth(prob,t,events)
+
+		flags = self.birdCam.flags
+		if isBird:
+			if not flags[2] or t-self.lastPicT>self.picInterval: # take first image, then new images as time passes
+				self.lastPicT = t
+				if self.birdCam.appendImSet(roi): # not when the image set is full
+					events.append(visitEvent('picture',t,roi=roi,species=species,confidence=confidence))
+			if flags[2]:
+				flags[1] = True
+			flags[2] = True
+			self.birdCam.appendDataArray(np.array([[species,confidence]]))
+			if self.ratCnt>=self.ratCntThresh and not self.deterrent:
+				self.deterrent = True
+				events.append(visitEvent('deterOn',t))
+		elif flags[1]: # bird initially gone from frame
+			self.lostTime = t
+			flags[1] = False
+			events.append(visitEvent('leaving',t))
+			self.deterOff(t,events)
+		elif t-self.lostTime>self.lostThresh: # bird gone too long
+			events.append(self.endVisit(t))
+			self.deterOff(t,events)
+		return events
+
+	def smooth(self,prob,t,events):
+		'''Feed the smoother. Return True if the smoother is in use.'''
+		if self.smoother is None or prob is None:
+			return False
+		decision = self.smoother.update(prob)
+		if decision is not None:
+			events.append(visitEvent('early',t,species=decision,confidence=self.smoother.posterior[decision]))
+			if decision==self.ratClass: # decided before the rat counter got there
+				self.ratCnt = max(self.ratCnt,self.ratCntThresh)
+		return True
+
+	def startVisit(self,species,confidence,t):
+		self.inVisit = True
+		self.birdCam.time = t
+		self.startT = self.lostTime = self.lastPicT = t
+		self.birdCam.resetImSet() # initialize image array
+		self.birdCam.resetDataArray()
+		self.birdCam.flags = [True,True,False] #update flags
+		self.birdCam.appendDataArray(np.array([[species,confidence]]))
+		self.ratCnt = 0
+		if self.smoother is not None:
+			self.smoother.reset()
+
+	def endVisit(self,t):
+		'''Close the visit. The gone event carries the final decision (species is None without pictures).'''
+		self.inVisit = False
+		self.birdCnt = 0
+		self.birdCam.resetFlags()
+		self.birdCam.resetFcnt(40) # reset frame counter
+		if self.birdCam.numImSet()==0:
+			return visitEvent('gone',t,species=None,confidence=0.0,vote=None,start=self.startT,duration=t-self.startT,roi=None)
+		species,confidence = self.birdCam.modeDataArray() # inference from all frames of the visit
+		vote = None
+		if self.smoother is not None and self.smoother.frames>0:
+			smoothSpecies,vote = self.smoother.final()
+			if smoothSpecies is not None and smoothSpecies!=species:
+				species = smoothSpecies
+				confidence = self.birdCam.confDataArray(species) # mean confidence of the frames classified as species
+				if confidence is None:
+					confidence = self.smoother.meanProb(species)
+		return visitEvent('gone',t,species=species,confidence=confidence,vote=vote,start=self.startT,duration=t-self.startT,
+			roi=self.birdCam.getImSet(3))
+
+	def deterOff(self,t,events):
+		if self.deterrent:
+			self.deterrent = False
+			events.append(visitEvent('deterOff',t))
+
+
+#-------------Self Check-----------------#
+def deterFrame(tracker,frames):
+	'''Frame number at which the deterrent turns on for a list of class probabilities, or None.'''
+	roi = np.zeros((8,8,3),dtype=np.uint8)
+	for k,prob in enumerate(frames):
+		species = int(np.argmax(prob))
+		for ev in tracker.update(roi,species,float(prob[species]),t=k/30.0,prob=prob):
+			if ev.kind=='deterOn':
+				return k
+	return None
+
+if __name__ == '__main__':
+	from birdCam_jetson_ml import birdCam
+	parser = argparse.ArgumentParser(description = "Check that the species smoother never turns the rat deterrent on later than the frame counter")
+	parser.add_argument("-n", "--visits", type=int,default=500,help="Number of random visits")
+	parser.add_argument("-s", "--seed", type=int,default=0,help="Random seed")
+	args = parser.parse_args()
+
+	className = ['Sparrow','Junco','Towhee','Juncojv','Rat','Snail','Blank']
+	ratClass = 5
+	rng = np.random.default_rng(args.seed)
+	late = 0
+	gain = []
+	for k in range(args.visits):
+		# a bird visit that turns into a rat visit with noisy confidences and a few misclassified frames
+		ratStart = int(rng.integers(0,20))
+		frames = []
+		for f in range(60):
+			prob = np.full(len(className),0.0)
+			species = ratClass if f>=ratStart and rng.random()>0.2 else int(rng.integers(0,5))
+			conf = rng.uniform(0.3,1.0)
+			prob += (1.0-conf)/(len(className)-1)
+			prob[species] = conf
+			frames.append(prob)
+		counter = deterFrame(visitTracker(birdCam(className=className),ratClass=ratClass),frames)
+		smoothed = deterFrame(visitTracker(birdCam(className=className),ratClass=ratClass,
+			smoother=speciesSmoother(len(className))),frames)
+		if counter is not None and (smoothed is None or smoothed>counter):
+			late = late+1
+			print("Visit %d: deterrent at frame %s with the smoother, %d with the counter"%(k,smoothed,counter))
+		elif counter is not None:
+			gain.append(counter-smoothed)
+	print("%d visits, smoother later than the counter in %d, %.2f frames earlier on average"%(args.visits,late,np.mean(gain) if gain else 0.0))
+	print("PASS" if late==0 else "FAIL")
+	sys.exit(0 if late==0 else 1)
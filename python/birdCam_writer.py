@@ -0,0 +1,147 @@
+#!/usr/bin/python
+
+# background image writer for Jetson Nano Bird Camera
+# October 2026
+
+import threading
+import queue
+import time
+import cv2
+
+
+#-------------Image Writer Class-----------------#
+class imageWriter():
+	'''Encode and save images on worker threads so the frame loop never waits on the SD card.
+	policy = 'block'      : write() waits for room in the queue
+	policy = 'drop'       : write() discards the new image when the queue is full
+	policy = 'dropOldest' : write() discards the oldest queued image that may be dropped when the queue is full
+	write(...,policy='block') overrides the policy for one image, e.g. visit records that must not be lost;
+	such images are never discarded to make room.
+	encodeParams maps a part of the destination path (e.g. 'blankIm/') to cv2.imwrite parameters;
+	the longest matching key is used.'''
+	def __init__(self,workers=1,maxQueue=16,policy='dropOldest',encodeParams={}):
+		if policy not in ('block','drop','dropOldest'):
+			raise ValueError("Unknown back-pressure policy %s"%policy)
+		self.policy = policy
+		self.encodeParams = encodeParams
+		self.queue = queue.Queue(maxsize=maxQueue)
+		self.lock = threading.Lock()
+
+		# statistics
+		self.written = 0
+		self.dropped = 0
+		self.failed = 0
+		self.writeTime = 0.0 # total time spent encoding and writing in s
+		self.latency = None # birdCam_metrics histogram of the write time per image
+
+		self.threads = []
+		for k in range(workers):
+			t = threading.Thread(target=self._run,name='imageWriter%d'%k)
+			t.daemon = True
+			t.start()
+			self.threads.append(t)
+
+	def setLatencyHistogram(self,hist):
+		'''Observe the encode and write time of every image in a birdCam_metrics histogram.'''
+		self.latency = hist
+
+	def params(self,fname):
+		'''Return the encode parameters for the given destination.'''
+		best = None
+		for key in self.encodeParams:
+			if key in fname and (best is None or len(key)>len(best)):
+				best = key
+		if best is None:
+			return []
+		return self.encodeParams[best]
+
+	def write(self,fname,im,copy=True,callback=None,policy=None):
+		'''Queue an image for writing. The image is copied unless copy=False, so the caller may keep
+		drawing on it. callback(fname) is called from the worker once the file is written.
+		policy overrides the writer policy for this image. Return False if the image was dropped.'''
+		if policy is None:
+			policy = self.policy
+		if copy:
+			im = im.copy()
+		job = (fname,im,callback,policy)
+		if policy=='block':
+			self.queue.put(job)
+			return True
+		with self.lock:
+			try:
+				self.queue.put_nowait(job)
+				return True
+			except queue.Full:
+				pass
+			self.dropped = self.dropped+1
+			if policy=='drop' or not self._dropOldest(): # nothing queued may be dropped: drop the new image
+				return False
+			try:
+				self.queue.put_nowait(job)
+			except queue.Full:
+				return False
+			return True
+
+	def _dropOldest(self):
+		'''Discard the oldest queued image that was not written with policy 'block'. Return False if there is none.'''
+		with self.queue.mutex:
+			jobs = self.queue.queue
+			for k in range(len(jobs)):
+				if jobs[k] is not None and jobs[k][3]!='block':
+					del jobs[k]
+					break
+			else:
+				return False
+			self.queue.not_full.notify()
+		self.queue.task_done()
+		return True
+
+	def _run(self):
+		while True:
+			job = self.queue.get()
+			if job is None: # stop signal from close()
+				self.queue.task_done()
+				return
+			fname,im,callback,policy = job
+			try:
+				startT = time.time()
+				try:
+					ok = cv2.imwrite(fname,im,self.params(fname))
+				except cv2.error as e:
+					print("Fail to write %s: %s"%(fname,e))
+					ok = False
+				dt = time.time()-startT
+				self.writeTime = self.writeTime+dt
+				if self.latency is not None:
+					self.latency.observe(dt)
+				if ok:
+					self.written = self.written+1
+					if callback is not None:
+						callback(fname)
+				else:
+					self.failed = self.failed+1
+			except Exception as e: # a failing callback must not kill the worker and hang flush()
+				print("Fail to finish %s: %s"%(fname,e))
+				self.failed = self.failed+1
+			finally:
+				self.queue.task_done()
+
+	def depth(self):
+		return self.queue.qsize()
+
+	def flush(self):
+		'''Wait until every queued image is written.'''
+		self.queue.join()
+
+	def close(self):
+		'''Flush the queue and stop the workers.'''
+		self.flush()
+		for t in self.threads:
+			self.queue.put(None)
+		for t in self.threads:
+			t.join(timeout=2)
+		self.threads = []
+
+	def stats(self):
+		meanWriteTime = self.writeTime/self.written if self.written>0 else 0.0
+		return {'depth':self.depth(),'written':self.written,'dropped':self.dropped,'failed':self.failed,'meanWriteTime':meanWriteTime}
@@ -1,5 +1,6 @@
 import signal
 from birdVid_jetson import *
+from birdCam_log import eventLog
 
 # for gracefully terminate program with SIGINT
 def terminateProcess(signalNumber, frame):
@@ -9,45 +10,56 @@ def terminateProcess(signalNumber, frame):
     print(terminate)
     return
 
-# for SIGNINT interruption
-terminate = False
-signal.signal(signal.SIGINT, terminateProcess)
+if __name__ == '__main__': # the video writer process imports this script again
+	# for SIGNINT interruption
+	terminate = False
+	signal.signal(signal.SIGINT, terminateProcess)
 
-# for foreground mask cleanup
-se = cv2.getStructuringElement(cv2.MORPH_ELLIPSE,(3,3))
+	# for foreground mask cleanup
+	se = cv2.getStructuringElement(cv2.MORPH_ELLIPSE,(3,3))
 
-birdVid = videoDetector(fgThresh=800)
+	startName = '%d'%time.time()
+	log = eventLog(startName+'.log',level='debug',consoleLevel='warning') # per-frame foreground counts, replay with birdCam_log.py
+	birdVid = videoDetector(fgThresh=800,preRollSec=3,log=log, # keep 3 s before the detection so clips include the arrival
+		writerProcess=True,writerSlots=16) # encode in its own process; frames are dropped when 16 are already waiting
 
-birdVid.initVideoStream(fps=30)
-# birdVid.initVideoStream(vidSize=(4000,3000),fps=30)
-birdVid.initGSTOutputVideo('%d.mp4'%time.time())
-# birdVid.initOutputVideo('test_out.mp4',fps=10)
-birdVid.initDetector()
+	birdVid.initVideoStream(fps=30,threaded=True,poolSize=16) # capture on its own thread so detection and recording overlap with it;
+	# frames reuse 16 buffers, bursts beyond that are allocated and counted as pool exhaustion
+	# birdVid.initVideoStream(vidSize=(4000,3000),fps=30)
+	birdVid.initGSTOutputVideo(startName+'.mp4')
+	# birdVid.initOutputVideo('test_out.mp4',fps=10)
+	birdVid.initDetector()
 
 
-srtT = time.time()
-fcnt = 0
-while True:
+	srtT = time.time()
+	fcnt = 0
+	while True:
 
-	fcnt = fcnt+1
-	ret_val, frame = birdVid.getFrame()
+		fcnt = fcnt+1
+		ret_val, frame = birdVid.getFrame()
 
-	if (frame is None) or (not ret_val):
-		print("Failed to read video frame")
-		break
+		if (frame is None) or (not ret_val):
+			print("Failed to read video frame")
+			break
 
-	if terminate:
-		print("Terminate processing from SIGINT")
-		break
+		if terminate:
+			print("Terminate processing from SIGINT")
+			break
 
-	birdVid.detectForeground()
-	birdVid.recordFrame()
+		birdVid.detectForeground()
+		birdVid.recordFrame()
 
-birdVid.closeVideoStream()
-birdVid.closeOutputVideo()
+	capStats = birdVid.captureStats()
+	birdVid.closeVideoStream()
+	birdVid.closeOutputVideo()
+	writerStats = birdVid.writerStats()
+	log.close()
 
-endT = time.time()
-tt = endT - srtT
+	endT = time.time()
+	tt = endT - srtT
 
-print("Finished processing video in %.2f s"%(tt))
-print("Analyzed %d frames at the rate of %.2f s/frame"%(fcnt,tt/fcnt))
\ No newline at end of file
+	print("Finished processing video in %.2f s"%(tt))
+	print("Analyzed %d frames at the rate of %.2f s/frame"%(fcnt,tt/fcnt))
+	print("Captured %d frames, dropped %d frames"%(capStats['captured'],capStats['dropped']))
+	print("Frame pool exhausted on %d frames"%capStats['poolExhausted'])
+	print("Wrote %d frames at %.1f frames/s of encode time, dropped %d frames"%(writerStats['written'],writerStats['encodeFps'],writerStats['dropped']))
\ No newline at end of file
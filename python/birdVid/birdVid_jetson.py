@@ -12,9 +12,18 @@ import glob
 import os
 from datetime import datetime
 import time
+import multiprocessing
+import signal
+import queue
+import threading
+import collections
 from datetime import datetime # for converting timestamp to readable format
 import pytz # for timezone in datetime
 
+# shared BirdCam modules live one folder up
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+from birdCam_stream import frameReader, framePool
+
 
 #-------------General Functions-----------------#
 def gstreamer_pipeline (capture_width=3280, capture_height=2464, display_width=1280, display_height=720, framerate=20, flip_method=0) :   
@@ -46,10 +55,10 @@ def tstmp2dt(tstmp,tz = "America/Los_Angeles"):
 #   return cv2.putText(im, text, org, font, 
 #                     fontScale, color, thickness, cv2.LINE_AA)
 
-def addTstamp2Im(im,org=(50,50),color=(0, 255, 255),fontScale=1.25,thickness=2,format = "%H:%M %d/%b/%y"):
+def addTstamp2Im(im,org=(50,50),color=(0, 255, 255),fontScale=1.25,thickness=2,format = "%H:%M %d/%b/%y",tstamp=None):
   '''Add a timestamp to an image.
-  tstamp = unix timestamp in string format.'''
-  dt = datetime.now()
+  tstamp = unix timestamp of the frame; the current time if not given.'''
+  dt = datetime.now() if tstamp is None else datetime.fromtimestamp(tstamp)
   text = dt.strftime(format)
   # font
   font = cv2.FONT_HERSHEY_SIMPLEX
@@ -57,9 +66,392 @@ def addTstamp2Im(im,org=(50,50),color=(0, 255, 255),fontScale=1.25,thickness=2,f
   return cv2.putText(im, text, org, font, 
                     fontScale, color, thickness, cv2.LINE_AA)
 
+def composeFrame(frame,mask,output_type,size,tstamp=None,copy=True):
+  '''Build the frame written to the output video at size=(w,h).
+  output_type = 'frame' (the camera frame), 'mask' (the foreground mask as a 3-channel image)
+  or 'composite' (foreground pixels of the frame over a darkened background).
+  A frame without a mask (e.g. from the pre-roll) is written as is. tstamp = unix time stamped
+  on the frame, None for no stamp. The stamp is drawn on a copy unless copy=False.'''
+  if frame is not None and (frame.shape[1],frame.shape[0])!=tuple(size):
+    frame = cv2.resize(frame,tuple(size))
+  if mask is None or output_type=='frame':
+    out = frame
+  else:
+    mask = cv2.resize(mask,tuple(size),interpolation=cv2.INTER_NEAREST)
+    if output_type=='mask':
+      out = cv2.cvtColor(mask,cv2.COLOR_GRAY2BGR)
+    else:
+      out = frame>>2 # background at a quarter of its brightness
+      np.copyto(out,frame,where=(mask>0)[:,:,None])
+  if tstamp is not None:
+    if copy and out is frame:
+      out = frame.copy()
+    out = addTstamp2Im(out,tstamp=tstamp)
+  return out
+
+def videoWriterMain(output,gst,fps,size,output_type,frameSlots,maskSlots,jobs,free,counters):
+  '''Body of the videoWriterProcess: open the writer, then compose and encode the frame of every
+  slot number received on jobs and hand the slot back on free, until None is received.
+  Ctrl-C reaches the whole process group; the writer ignores it and stops on release() of the parent,
+  after the queued frames are written.'''
+  signal.signal(signal.SIGINT,signal.SIG_IGN)
+  if gst:
+    out = cv2.VideoWriter(output,cv2.CAP_GSTREAMER,0,float(fps),size)
+  else:
+    out = cv2.VideoWriter(output,cv2.VideoWriter_fourcc(*'MP4V'),fps,size)
+  counters[2] = 1.0 if out.isOpened() else -1.0
+  w,h = size
+  frames = [np.frombuffer(s,dtype=np.uint8).reshape(h,w,3) for s in frameSlots]
+  masks = [np.frombuffer(s,dtype=np.uint8) for s in maskSlots]
+  try:
+    while True:
+      job = jobs.get()
+      if job is None: # stop signal
+        break
+      k,tstamp,maskShape = job
+      startT = time.perf_counter()
+      frame = frames[k] if len(frames)>0 else None
+      mask = masks[k][:maskShape[0]*maskShape[1]].reshape(maskShape) if maskShape is not None else None
+      im = composeFrame(frame,mask,output_type,size,tstamp,copy=False) # the slot is ours until it is handed back
+      if im is not None: # a mask output job without a mask has nothing to write
+        out.write(im)
+      counters[1] = counters[1]+time.perf_counter()-startT
+      counters[0] = counters[0]+1
+      free.put(k)
+  finally:
+    out.release()
+
+def seekFrame(cap,f,fps,margin=None):
+  """Position a video capture so that the next read() returns frame f.
+  Seeking by CAP_PROP_POS_FRAMES is only keyframe-accurate on H.264/MP4, so seek to before f
+  (margin frames, 2 s by default, doubled if the seek still lands after f) and read forward,
+  counting frames from the decoded timestamps. Return False if the video ends before f."""
+  cap.set(cv2.CAP_PROP_POS_FRAMES,0)
+  if f<=0:
+    return True
+  back = margin if margin is not None else max(1,int(2*fps))
+  while True:
+    target = max(0,f-back)
+    cap.set(cv2.CAP_PROP_POS_FRAMES,target)
+    if not cap.grab():
+      return False
+    cur = int(round(cap.get(cv2.CAP_PROP_POS_MSEC)*fps/1000.0)) # frame number of the grabbed frame
+    if cur<f or target==0:
+      break
+    back = back*2
+  while cur<f-1:
+    if not cap.grab():
+      return False
+    cur = int(round(cap.get(cv2.CAP_PROP_POS_MSEC)*fps/1000.0))
+  return True
+
+def detectChunk(job):
+  """Run motion detection on frames [start,end) of a video file in a worker process.
+  The detector first runs over `warmup` frames before start so that the MOG2 background model
+  and the detection counters converge. Recorded frames are written to partName.
+  Return (chunk index, motion intervals as [first,last+1) frame numbers, partName, recorded frames)."""
+  vidFile,k,start,end,warmup,vidSize,outFps,params,partName = job
+  cv2.setNumThreads(1) # parallelism comes from the process pool
+  det = videoDetector(**params)
+  det.initVideoStream(vidSize=vidSize,vidFile=vidFile,poolSize=2)
+  f = max(0,start-warmup)
+  seekFrame(det.cap,f,det.fps)
+  det.initDetector()
+  det.initOutputVideo(partName,fps=outFps,vidSize=vidSize)
+  intervals = []
+  cur = None
+  while f<end:
+    ret_val, frame = det.getFrame()
+    if (frame is None) or (not ret_val):
+      break
+    det.detectForeground()
+    if f>=start:
+      det.recordFrame()
+      if det.recordStat:
+        if cur is None:
+          cur = [f,f]
+        cur[1] = f+1
+      elif cur is not None:
+        intervals.append(tuple(cur))
+        cur = None
+    f = f+1
+  if cur is not None:
+    intervals.append(tuple(cur))
+  det.closeVideoStream()
+  det.closeOutputVideo()
+  return k,intervals,partName,det.motion_frames
+
+def mergeIntervals(intervals):
+  """Merge touching or overlapping [first,last+1) frame intervals."""
+  merged = []
+  for a,b in sorted(intervals):
+    if merged and a<=merged[-1][1]:
+      merged[-1] = (merged[-1][0],max(merged[-1][1],b))
+    else:
+      merged.append((a,b))
+  return merged
+
+def parallelDetect(vidFile,output_vidname,workers=None,chunkSec=300,warmupSec=20,outFps=10.0,vidSize=(1920,1080),**params):
+  """Split a video into time chunks, detect motion in a process pool and join the recorded clips in order.
+  params are passed to videoDetector. Return the merged motion intervals in frame numbers.
+  Frames are detected and written at vidSize, like a serial run with the same vidSize (the foreground threshold
+  counts pixels, so the size changes the decisions). The result must match the serial run; a warm-up shorter
+  than a motion clip can end it early at a chunk boundary.
+  Videos that do not report their frame count or frame rate are processed serially."""
+  cap = cv2.VideoCapture(vidFile)
+  if not cap.isOpened():
+    sys.exit("Unable to open video %s"%vidFile)
+  n = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+  fps = cap.get(cv2.CAP_PROP_FPS)
+  cap.release()
+  vidSize = (int(vidSize[0]),int(vidSize[1]))
+
+  if n<=0 or fps<=0: # cannot be split into chunks
+    print("Unknown frame count or rate, processing the video serially")
+    results = [detectChunk((vidFile,0,0,sys.maxsize,0,vidSize,outFps,params,'%s.part000.mp4'%output_vidname))]
+  else:
+    chunk = max(1,int(chunkSec*fps))
+    warmup = int(warmupSec*fps)
+    jobs = []
+    for k,start in enumerate(range(0,n,chunk)):
+      jobs.append((vidFile,k,start,min(start+chunk,n),warmup,vidSize,outFps,params,'%s.part%03d.mp4'%(output_vidname,k)))
+    print("Processing %d frames in %d chunks"%(n,len(jobs)))
+
+    pool = multiprocessing.Pool(workers)
+    results = pool.map(detectChunk,jobs) # results come back in chunk order
+    pool.close()
+    pool.join()
+
+  # join the part clips in chunk order
+  fourcc = cv2.VideoWriter_fourcc(*'MP4V')
+  output_vid = cv2.VideoWriter(output_vidname,fourcc,outFps,vidSize)
+  intervals = []
+  for k,chunkIntervals,partName,motion_frames in results:
+    intervals.extend(chunkIntervals)
+    part = cv2.VideoCapture(partName)
+    while True:
+      ret_val, frame = part.read()
+      if (frame is None) or (not ret_val):
+        break
+      output_vid.write(frame)
+    part.release()
+    os.remove(partName)
+  output_vid.release()
+  return mergeIntervals(intervals)
+
+class prerollBuffer():
+	'''Bounded buffer of the most recent frames before recording starts.
+	push() only downscales the frame by `scale` (a new array, so pooled frames can be reused) and stores
+	it with its capture time. With mode='jpeg' the frames are JPEG-encoded in memory on a background
+	thread; mode='raw' keeps the downscaled copies. The buffer holds at most maxFrames frames and
+	maxBytes bytes; frames are time-stamped when they are drained, not in the detection loop.'''
+	def __init__(self,maxFrames,maxBytes=64e6,mode='jpeg',scale=0.5,quality=85):
+		self.maxFrames = maxFrames
+		self.maxBytes = maxBytes
+		self.mode = mode
+		self.scale = scale
+		self.quality = quality
+		self.frames = collections.deque() # (frame or JPEG buffer, capture time)
+		self.bytes = 0
+		self.dropped = 0 # frames pushed out by the frame or memory cap, or by a busy encoder
+		self.lock = threading.Lock()
+		self.encodeQueue = None
+		if mode=='jpeg':
+			self.encodeQueue = queue.Queue(maxsize=8)
+			self.thread = threading.Thread(target=self._run,name='prerollEncoder')
+			self.thread.daemon = True
+			self.thread.start()
+
+	def __len__(self):
+		return len(self.frames)+(self.encodeQueue.unfinished_tasks if self.encodeQueue is not None else 0)
+
+	def push(self,frame,t=None):
+		if t is None:
+			t = time.time()
+		if self.scale!=1.0:
+			frame = cv2.resize(frame,(0,0),fx=self.scale,fy=self.scale,interpolation=cv2.INTER_LINEAR)
+		else:
+			frame = frame.copy()
+		if self.encodeQueue is None:
+			self._append(frame,t)
+			return
+		try:
+			self.encodeQueue.put_nowait((frame,t))
+		except queue.Full: # the encoder cannot keep up; losing a pre-roll frame is better than stalling detection
+			self.dropped = self.dropped+1
+
+	def _append(self,frame,t):
+		with self.lock:
+			self.frames.append((frame,t))
+			self.bytes = self.bytes+frame.nbytes
+			while len(self.frames)>self.maxFrames or self.bytes>self.maxBytes:
+				self.bytes = self.bytes-self.frames.popleft()[0].nbytes
+				self.dropped = self.dropped+1
+
+	def _run(self):
+		while True:
+			item = self.encodeQueue.get()
+			if item is None: # stop signal from close()
+				self.encodeQueue.task_done()
+				return
+			frame,t = item
+			try:
+				_,buf = cv2.imencode('.jpg',frame,[cv2.IMWRITE_JPEG_QUALITY,self.quality])
+				self._append(buf,t)
+			finally:
+				self.encodeQueue.task_done()
+
+	def drain(self,size=None):
+		'''Yield the buffered (frame, capture time) pairs in order, with frames resized to size=(w,h)
+		if given, and empty the buffer.'''
+		if self.encodeQueue is not None:
+			self.encodeQueue.join() # frames still being encoded
+		while True:
+			with self.lock:
+				if len(self.frames)==0:
+					return
+				frame,t = self.frames.popleft()
+				self.bytes = self.bytes-frame.nbytes
+			if self.mode=='jpeg':
+				frame = cv2.imdecode(frame,cv2.IMREAD_COLOR)
+			if size is not None and (frame.shape[1],frame.shape[0])!=tuple(size):
+				frame = cv2.resize(frame,tuple(size))
+			yield frame,t
+
+	def clear(self):
+		'''Drop the buffered frames.'''
+		with self.lock:
+			self.dropped = self.dropped+len(self.frames)
+			self.frames.clear()
+			self.bytes = 0
+
+	def close(self):
+		if self.encodeQueue is not None:
+			self.encodeQueue.put(None)
+			self.thread.join(timeout=2)
+
+class videoWriterProcess():
+	'''Encode the output video in a separate process, so encoder stalls do not hold up detection.
+	write() copies the frame (and the foreground mask) into one of `slots` preallocated shared-memory
+	buffers and sends the slot number to the process, which composes, time-stamps and encodes it, then
+	hands the slot back. At most `slots` frames are in flight. When all are busy, policy='drop' drops
+	the new frame and policy='block' waits for the writer.
+	output = file name, or a GStreamer pipeline if gst = True.
+	The process is started with the 'spawn' method (a fork would copy the running capture's GStreamer
+	threads), which imports the main script again, so scripts using it need a __main__ guard.'''
+	def __init__(self,output,fps,size,output_type='frame',gst=False,slots=8,policy='drop',maskSize=None):
+		self.size = (int(size[0]),int(size[1]))
+		self.output_type = output_type
+		self.policy = policy
+		w,h = self.size
+		# the mask output does not need the frames, the frame output does not need the masks
+		nFrame = slots if output_type!='mask' else 0
+		nMask = slots if output_type!='frame' else 0
+		maskBytes = maskSize[0]*maskSize[1] if maskSize is not None else w*h
+		ctx = multiprocessing.get_context('spawn')
+		frameSlots = [ctx.RawArray('B',w*h*3) for k in range(nFrame)]
+		maskSlots = [ctx.RawArray('B',maskBytes) for k in range(nMask)]
+		self.frames = [np.frombuffer(s,dtype=np.uint8).reshape(h,w,3) for s in frameSlots]
+		self.masks = [np.frombuffer(s,dtype=np.uint8) for s in maskSlots]
+		self.jobs = ctx.Queue(maxsize=slots+1) # every slot and the stop signal
+		self.free = ctx.Queue()
+		for k in range(slots):
+			self.free.put(k)
+		self.counters = ctx.RawArray('d',3) # written, encode time in s, opened (1) or failed (-1)
+
+		# statistics
+		self.slots = slots
+		self.submitted = 0
+		self.dropped = 0
+		self.blockTime = 0.0
+
+		self.process = ctx.Process(target=videoWriterMain,name='videoWriter',
+			args=(output,gst,fps,self.size,output_type,frameSlots,maskSlots,self.jobs,self.free,self.counters))
+		self.process.daemon = True
+		self.process.start()
+
+	def isOpened(self):
+		'''Wait until the process has opened the writer and return True if it succeeded.'''
+		while self.counters[2]==0 and self.process.is_alive():
+			time.sleep(0.01)
+		return self.counters[2]>0
+
+	def write(self,frame,mask=None,tstamp=None,block=None,timeout=None):
+		'''Queue a frame for encoding. block overrides the drop policy for this frame; a blocking write
+		waits at most timeout s for a free slot (as long as the process runs if None).
+		Return False if the frame was dropped.'''
+		if block is None:
+			block = self.policy=='block'
+		if (self.output_type=='mask' and mask is None) or not self.process.is_alive():
+			self.dropped = self.dropped+1 # nothing to encode (e.g. a pre-roll frame), or nobody to encode it
+			return False
+		try:
+			k = self.free.get_nowait()
+		except queue.Empty:
+			if not block:
+				self.dropped = self.dropped+1
+				return False
+			startT = time.perf_counter()
+			k = self.waitSlot(timeout)
+			self.blockTime = self.blockTime+time.perf_counter()-startT
+			if k is None:
+				self.dropped = self.dropped+1
+				return False
+		if len(self.frames)>0:
+			if (frame.shape[1],frame.shape[0])!=self.size:
+				frame = cv2.resize(frame,self.size)
+			np.copyto(self.frames[k],frame)
+		maskShape = None
+		if mask is not None and len(self.masks)>0:
+			maskShape = mask.shape
+			np.copyto(self.masks[k][:mask.size].reshape(maskShape),mask)
+		self.jobs.put((k,tstamp,maskShape))
+		self.submitted = self.submitted+1
+		return True
+
+	def waitSlot(self,timeout=None):
+		'''Wait for a free slot while the process is alive. Return None after timeout s or if the process died.'''
+		deadline = None if timeout is None else time.perf_counter()+timeout
+		while self.process.is_alive():
+			wait = 0.5 if deadline is None else min(0.5,deadline-time.perf_counter())
+			if wait<=0:
+				return None
+			try:
+				return self.free.get(timeout=wait)
+			except queue.Empty:
+				pass
+		return None
+
+	def release(self,timeout=10.0):
+		'''Encode the frames still queued and stop the process. A process that has not finished
+		after timeout s is killed.'''
+		if self.process.is_alive():
+			try:
+				self.jobs.put(None,timeout=timeout)
+			except queue.Full:
+				pass
+			self.process.join(timeout)
+		if self.process.is_alive():
+			print("Video writer did not stop. Killing it.")
+			self.process.kill() # also stops a writer stuck inside the encoder
+			self.process.join()
+		if self.process.exitcode!=0:
+			print("Video writer exited with code %s"%self.process.exitcode)
+			self.jobs.cancel_join_thread() # nobody reads the jobs left in the pipe
+
+	def stats(self):
+		'''Submitted, written and dropped frames, frames in flight, encode rate of the writer (frames/s of
+		encode time), mean encode time per frame in s and time spent waiting for a free slot in s.'''
+		written = int(self.counters[0])
+		encodeTime = self.counters[1]
+		return {'submitted':self.submitted,'written':written,'dropped':self.dropped,'queued':self.submitted-written,
+			'encodeFps':written/encodeTime if encodeTime>0 else 0.0,'encodeTime':encodeTime/max(written,1),
+			'blockTime':self.blockTime}
+
 class videoDetector():
 
-	def __init__(self,output_type='frame',fgThresh=150,contDetectThresh=60,max_invis_frames=90):
+	def __init__(self,output_type='frame',fgThresh=150,contDetectThresh=60,max_invis_frames=90,preRollSec=0,postRollSec=None,prerollMode='jpeg',prerollScale=0.5,prerollMaxBytes=64e6,prerollWait=1.0,log=None,
+			writerProcess=False,writerSlots=8,writerPolicy='drop'):
 		self.fgThresh = fgThresh
 		self.contDetectThresh = contDetectThresh
 		# self.se_array = se_array
@@ -67,12 +459,37 @@ class videoDetector():
 		self.max_invis_frames = max_invis_frames
 		self.output_type = output_type
 
-	def initVideoStream(self,vidSize=(1920,1080),fps=30,vidFile=' '):
+		# pre-roll keeps the frames before recording starts; post-roll (if given) overrides max_invis_frames
+		self.preRollSec = preRollSec
+		self.postRollSec = postRollSec
+		self.prerollMode = prerollMode
+		self.prerollScale = prerollScale
+		self.prerollMaxBytes = prerollMaxBytes
+		self.prerollWait = prerollWait # longest time in s that writing the pre-roll may hold up detection
+		self.preroll = None
+		self.reader = None # threaded frame reader, created in initVideoStream
+		self.pool = None # preallocated frame buffers, created in initVideoStream
+		self.frame = None
+		self.log = log # birdCam_log.eventLog for the per-frame foreground count
+		self.mask = None
+
+		# encode in a videoWriterProcess; not possible inside a process pool worker (detectChunk)
+		self.writerProcess = writerProcess
+		self.writerSlots = writerSlots
+		self.writerPolicy = writerPolicy
+
+	def initVideoStream(self,vidSize=(1920,1080),fps=30,vidFile=' ',threaded=False,ringSize=60,policy='every',poolSize=None):
 		'''
 		Initialize opencv video capture.
 		INPUT: 	vidFile = filename of video to run; if left blank, BirdCam uses gstreamer for capture
+				threaded = if True, frames are captured on a background thread (see birdCam_stream.frameReader)
+				ringSize, policy = size and read policy ('latest' or 'every') of the capture ring
+				poolSize = if given, frames are read into that many preallocated buffers (see birdCam_stream.framePool);
+				           a frame is then only valid until the next getFrame()
 		OUTPUT: boolean True if successfully open video capture stream
 		'''
+		if poolSize is not None:
+			self.pool = framePool(poolSize)
 		self.gstream = gstreamer_pipeline(capture_width=vidSize[0], capture_height=vidSize[1], display_width=vidSize[0], display_height=vidSize[1],framerate=fps)
 		self.vidSize = vidSize
 		if vidFile==' ': # gstreamer mode
@@ -96,37 +513,81 @@ class videoDetector():
 			print('-------------------------')
 			print('Src opened, %dx%d @ %d fps' % (self.w, self.h, self.fps))
 			print('-------------------------')
+			if threaded:
+				# a video file has no real-time deadline, so the capture thread waits instead of dropping
+				self.reader = frameReader(self.cap,ringSize=ringSize,policy=policy,block=(vidFile!=' '),pool=self.pool).start()
 			return True
 
 	def closeVideoStream(self):
+		if self.reader is not None:
+			self.reader.stop()
+		if self.preroll is not None:
+			self.preroll.close()
 		self.cap.release()
 
 	def getFrame(self):
-		ret_val, frame = self.cap.read()
+		if self.pool is not None and self.frame is not None: # previous frame goes back to the pool
+			self.pool.release(self.frame)
+		if self.reader is not None:
+			ret_val, frame = self.reader.read()
+		elif self.pool is not None:
+			ret_val, frame = self.pool.read(self.cap)
+		else:
+			ret_val, frame = self.cap.read()
 		self.frame = frame
 		return ret_val,frame
 
+	def captureStats(self):
+		'''Return capture statistics (captured, dropped, stale, depth) of the threaded reader
+		and the frame pool statistics (poolFree, poolExhausted).'''
+		if self.reader is not None:
+			return self.reader.stats()
+		if self.pool is not None:
+			return {'poolFree':self.pool.free(),'poolExhausted':self.pool.exhausted}
+		return {}
+
 	def initOutputVideo(self,output_vidname,fps=10.0,vidSize=(1920,1080)):
 		self.output_vidname = output_vidname
-		fourcc = cv2.VideoWriter_fourcc(*'MP4V')
-		self.output_vid = cv2.VideoWriter(self.output_vidname,fourcc, fps, vidSize)
 		self.output_vidSize = vidSize
+		self.openWriter(output_vidname,fps,vidSize,gst=False)
 
 	def initGSTOutputVideo(self,output_vidname,fps=10.0,vidSize=(1920,1080)):
 		self.output_vidname = output_vidname
 		gst_out = ("appsrc ! video/x-raw, format=BGR ! queue !"
 		" videoconvert ! video/x-raw,format=BGRx ! nvvidconv !"
 		" nvv4l2h264enc ! h264parse ! matroskamux ! filesink location=%s ")%output_vidname
-		self.output_vid = cv2.VideoWriter(gst_out, cv2.CAP_GSTREAMER, 0, float(self.fps), (int(self.w), int(self.h)))
+		self.output_vidSize = (int(self.w), int(self.h)) # the writer takes frames at the stream size
+		self.openWriter(gst_out,self.fps,self.output_vidSize,gst=True)
 		if not self.output_vid.isOpened():
 			print("Failed to open output")
 			exit()
 
-		self.output_vidSize = vidSize
+	def openWriter(self,output,fps,vidSize,gst):
+		if self.writerProcess:
+			maskSize = self.vidSize # large enough for the detectForeground mask at any scale
+			self.output_vid = videoWriterProcess(output,fps,vidSize,output_type=self.output_type,gst=gst,
+				slots=self.writerSlots,policy=self.writerPolicy,maskSize=maskSize)
+		elif gst:
+			self.output_vid = cv2.VideoWriter(output, cv2.CAP_GSTREAMER, 0, float(fps), vidSize)
+		else:
+			fourcc = cv2.VideoWriter_fourcc(*'MP4V')
+			self.output_vid = cv2.VideoWriter(output,fourcc, fps, vidSize)
 
 	def closeOutputVideo(self):
 		self.output_vid.release()
 
+	def writerStats(self):
+		'''Return the statistics of the videoWriterProcess (written, dropped, encodeFps, ...).'''
+		if self.writerProcess:
+			return self.output_vid.stats()
+		return {}
+
+	def writeFrame(self,frame,mask=None,tstamp=None,block=None,timeout=None):
+		if self.writerProcess:
+			self.output_vid.write(frame,mask,tstamp,block=block,timeout=timeout)
+		else:
+			self.output_vid.write(composeFrame(frame,mask,self.output_type,self.output_vidSize,tstamp))
+
 	def initDetector(self):
 		self.fgbg = cv2.createBackgroundSubtractorMOG2()
 		# detection frame counter handlers
@@ -135,15 +596,24 @@ class videoDetector():
 		self.recordStat = False
 		self.motion_frames = 0
 
+		fps = self.fps if self.fps>0 else 30
+		if self.postRollSec is not None:
+			self.max_invis_frames = int(self.postRollSec*fps)
+		if self.preRollSec>0 and self.output_type!='mask':
+			self.preroll = prerollBuffer(int(self.preRollSec*fps),maxBytes=self.prerollMaxBytes,mode=self.prerollMode,scale=self.prerollScale)
+
 	def detectForeground(self,scale=4):
 		fsmall = cv2.resize(self.frame,(int(self.vidSize[0]/scale),int(self.vidSize[1]/scale)))
 		fgmask = self.fgbg.apply(fsmall)
 		ret,mask = cv2.threshold(fgmask,250,255,cv2.THRESH_BINARY)
 		# im_open = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self.se_array[0])
 		# mask = im_open
-		print('%.2f,%.1f'%(time.time(),np.sum(mask)/255))
+		self.mask = mask
+		fgCnt = cv2.countNonZero(mask)
+		if self.log is not None:
+			self.log.debug('foreground',pixels=fgCnt,recording=self.recordStat)
 		# if foreground pixles are more than threshold, then add to counter 
-		if np.sum(mask)/255>=self.fgThresh: 
+		if fgCnt>=self.fgThresh: 
 			self.detect_frames = self.detect_frames+1
 			self.invis_frames = 0 # reset invis frame counter
 		elif self.recordStat: # if we are currently recording,
@@ -158,15 +628,17 @@ class videoDetector():
 	def recordFrame(self):
 		# recording
 		if self.recordStat:
+			if self.preroll is not None and len(self.preroll)>0: # recording just started, write the pre-roll first
+				deadline = time.perf_counter()+self.prerollWait
+				for frame,t in self.preroll.drain(self.output_vidSize):
+					wait = deadline-time.perf_counter()
+					if wait<=0: # out of time; the rest of the pre-roll is dropped
+						self.preroll.clear()
+						break
+					self.writeFrame(frame,tstamp=t,block=True,timeout=wait) # wait for the writer rather than lose the arrival
+					self.motion_frames = self.motion_frames+1
 			self.motion_frames = self.motion_frames+1
-			if self.output_type=='mask':
-				mask2 = cv2.resize(self.mask,self.output_vidSize)
-				mask3 = np.zeros((self.output_vidSize[0],self.output_vidSize[1]))
-				mask3[:,:,0] = mask2
-				mask3[:,:,1] = mask2
-				mask3[:,:,2] = mask2
-				self.output_vid.write(addTstamp2Im(mask3))
-			else:
-				#frame = cv2.resize(self.frame,(self.output_vidSize[0],self.output_vidSize[1]))
-				self.output_vid.write(addTstamp2Im(self.frame))
-				# self.output_vid.write(self.frame)
\ No newline at end of file
+			mask = self.mask if self.output_type!='frame' else None
+			self.writeFrame(self.frame,mask,time.time())
+		elif self.preroll is not None: # keep the frames before recording starts with their capture time
+			self.preroll.push(self.frame)
@@ -1,4 +1,5 @@
 import signal
+import argparse
 from birdVid_jetson import *
 
 # for gracefully terminate program with SIGINT
@@ -9,47 +10,68 @@ def terminateProcess(signalNumber, frame):
     print(terminate)
     return
 
-# for SIGNINT interruption
-terminate = False
-signal.signal(signal.SIGINT, terminateProcess)
+if __name__ == '__main__': # the video writer process imports this script again
+	# argument parser
+	parser = argparse.ArgumentParser(description = "BirdVid motion detection on a recorded video")
+	parser.add_argument("-i", "--input", type=str, default="1627193035.mp4",help="Input video")
+	parser.add_argument("-o", "--output", type=str, default="1627193035_out.mp4",help="Output video with the motion clips")
+	parser.add_argument("-j", "--workers", type=int, default=1,help="Number of worker processes. 1 processes the video serially; more workers give the same motion clips")
+	parser.add_argument("-c", "--chunk", type=float, default=300,help="Chunk length in seconds for parallel processing")
+	parser.add_argument("-s", "--size", type=int, nargs=2, default=[1920,1080],help="Width and height at which frames are detected and written, in both modes")
+	parser.add_argument("-w", "--warmup", type=float, default=20,help="Seconds before each chunk used to warm up the background model. Too short a warm-up can end clips early at chunk boundaries")
+	args = parser.parse_args()
 
-# for foreground mask cleanup
-se = cv2.getStructuringElement(cv2.MORPH_ELLIPSE,(3,3))
+	# for SIGNINT interruption
+	terminate = False
+	signal.signal(signal.SIGINT, terminateProcess)
 
-birdVid = videoDetector()
+	# for foreground mask cleanup
+	se = cv2.getStructuringElement(cv2.MORPH_ELLIPSE,(3,3))
 
-birdVid.initVideoStream(vidFile='1627193035.mp4')
-birdVid.initOutputVideo('1627193035_out.mp4')
-birdVid.initDetector()
+	if args.workers>1:
+		srtT = time.time()
+		intervals = parallelDetect(args.input,args.output,workers=args.workers,chunkSec=args.chunk,warmupSec=args.warmup,vidSize=tuple(args.size))
+		print("Finished processing video in %.2f s with %d workers"%(time.time()-srtT,args.workers))
+		for a,b in intervals:
+			print("Motion from frame %d to %d"%(a,b))
+		sys.exit()
 
+	birdVid = videoDetector(writerProcess=True,writerPolicy='block') # a recorded video can wait for the encoder
 
-srtT = time.time()
-fcnt = 0
-while True:
+	birdVid.initVideoStream(vidSize=tuple(args.size),vidFile=args.input,poolSize=2)
+	birdVid.initOutputVideo(args.output,vidSize=tuple(args.size))
+	birdVid.initDetector()
 
-	fcnt = fcnt+1
-	ret_val, frame = birdVid.getFrame()
 
-	if frame is None:
-		print("End of video file")
-		break
+	srtT = time.time()
+	fcnt = 0
+	while True:
 
-	if not ret_val:
-		print("Failed to read video frame")
-		break
+		fcnt = fcnt+1
+		ret_val, frame = birdVid.getFrame()
 
-	if terminate:
-		print("Terminate processing from SIGINT")
-		break
+		if frame is None:
+			print("End of video file")
+			break
 
-	birdVid.detectForeground()
-	birdVid.recordFrame()
+		if not ret_val:
+			print("Failed to read video frame")
+			break
 
-birdVid.closeVideoStream()
-birdVid.closeOutputVideo()
+		if terminate:
+			print("Terminate processing from SIGINT")
+			break
 
-endT = time.time()
-tt = endT - srtT
+		birdVid.detectForeground()
+		birdVid.recordFrame()
 
-print("Finished processing video in %.2f s"%(tt))
-print("Analyzed %d frames at the rate of %.2f s/frame"%(fcnt,tt/fcnt))
\ No newline at end of file
+	birdVid.closeVideoStream()
+	birdVid.closeOutputVideo()
+	writerStats = birdVid.writerStats()
+
+	endT = time.time()
+	tt = endT - srtT
+
+	print("Finished processing video in %.2f s"%(tt))
+	print("Analyzed %d frames at the rate of %.2f s/frame"%(fcnt,tt/fcnt))
+	print("Wrote %d frames at %.1f frames/s of encode time, waited %.2f s for the writer"%(writerStats['written'],writerStats['encodeFps'],writerStats['blockTime']))
\ No newline at end of file